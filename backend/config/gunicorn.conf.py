@@ -0,0 +1,60 @@
+"""
+Gunicorn configuration for the production server.
+
+Usage: gunicorn -c config/gunicorn.conf.py config.wsgi
+
+The application (Django and the prediction model) is loaded once in the
+master process and then forked, so worker processes share its memory pages
+copy-on-write instead of each loading their own copy.
+
+All settings can be overridden with environment variables:
+    GUNICORN_BIND            Address to listen on (default 0.0.0.0:8000)
+    GUNICORN_WORKERS         Worker processes (default 2 * CPU cores + 1)
+    GUNICORN_THREADS         Threads per worker (default 1)
+    GUNICORN_TIMEOUT         Seconds before a silent worker is restarted (default 30)
+    GUNICORN_GRACEFUL_TIMEOUT  Seconds to finish requests on restart (default 30)
+    GUNICORN_KEEPALIVE       Seconds to hold idle keep-alive connections (default 5)
+    GUNICORN_MAX_REQUESTS    Recycle a worker after this many requests, 0 = never (default 0)
+    GUNICORN_ACCESSLOG       Access log file, '-' for stdout, empty to disable (default -)
+"""
+
+import gc
+import multiprocessing
+import os
+
+# Load the model in the master before forking so workers inherit it.
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('PREDICTIONS_WARM_MODEL', 'True')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+# Rate-limit buckets are per process; split the configured rates between workers.
+os.environ.setdefault('PREDICTIONS_THROTTLE_WORKERS', str(workers))
+
+preload_app = True
+worker_class = 'gthread' if threads > 1 else 'sync'
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-') or None
+errorlog = '-'
+
+
+def when_ready(server):
+    """
+    Move everything allocated while preloading into the permanent GC generation.
+
+    Without this, the first collection in each worker touches the reference
+    counts of every preloaded object and copies those pages into the worker.
+    """
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Close database connections inherited from the master process."""
+    from django.db import connections
+    connections.close_all()
@@ -4,6 +4,7 @@ Django settings for home price prediction project.
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -33,8 +34,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'predictions.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    # After CorsMiddleware so that 503 responses carry CORS headers
+    'predictions.middleware.LoadSheddingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -64,13 +68,63 @@ TEMPLATES = [
 WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
+DATABASE_NAME = os.getenv('DATABASE_NAME', 'db.sqlite3')
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': BASE_DIR / DATABASE_NAME,
     }
 }
 
+# Sharding: predictions are spread over PREDICTIONS_SHARD_COUNT SQLite files
+# by a hash of the session token. Shard 0 is 'default'; shard i is
+# 'shard_<i>' stored next to it as db.shard<i>.sqlite3. When reducing the
+# count, set PREDICTIONS_SHARD_DATABASES to the old count so the retired
+# shards stay configured until `manage.py rebalance_shards` has emptied them.
+PREDICTIONS_SHARD_COUNT = int(os.getenv('PREDICTIONS_SHARD_COUNT', '1'))
+_shard_databases = max(PREDICTIONS_SHARD_COUNT, int(os.getenv('PREDICTIONS_SHARD_DATABASES', '0')))
+_db_stem, _db_suffix = os.path.splitext(DATABASE_NAME)
+for _index in range(1, _shard_databases):
+    DATABASES[f'shard_{_index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'{_db_stem}.shard{_index}{_db_suffix}',
+    }
+
+# Read replicas: each shard gets a read-only copy ('replica_<alias>', stored
+# as <name>.replica.sqlite3) refreshed by `manage.py refresh_replicas`.
+# History and summary reads use it; a session that just wrote reads from
+# the primary until the replica has been refreshed since the write, and
+# reads fall back to the primary when the replica is older than
+# PREDICTIONS_REPLICA_MAX_LAG.
+PREDICTIONS_REPLICAS_ENABLED = os.getenv('PREDICTIONS_REPLICAS_ENABLED', 'False').lower() in ('true', '1', 'yes')
+PREDICTIONS_REPLICA_REFRESH_SECONDS = float(os.getenv('PREDICTIONS_REPLICA_REFRESH_SECONDS', '5'))
+PREDICTIONS_REPLICA_MAX_LAG = float(os.getenv('PREDICTIONS_REPLICA_MAX_LAG', '60'))
+if PREDICTIONS_REPLICAS_ENABLED:
+    for _alias, _config in list(DATABASES.items()):
+        _stem, _suffix = os.path.splitext(str(_config['NAME']))
+        DATABASES[f'replica_{_alias}'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f'{_stem}.replica{_suffix}',
+            'TEST': {'MIRROR': _alias},
+        }
+
+DATABASE_ROUTERS = [
+    'predictions.routers.ReplicaRouter',
+    'predictions.routers.ShardRouter',
+]
+
+# Caches. 'replica_pins' holds the read-your-writes pins and must be shared
+# by every worker process, so it lives on the filesystem by default.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'replica_pins': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('REPLICA_PIN_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'geviti-replica-pins')),
+    },
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -102,7 +156,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'predictions.throttling.SessionRateThrottle',
+    ],
+    # Number of trusted proxies in front of Gunicorn. With 0, throttling keys
+    # on REMOTE_ADDR and ignores the client-supplied X-Forwarded-For header.
+    'NUM_PROXIES': int(os.getenv('THROTTLE_NUM_PROXIES', '0')),
 }
 
 # CORS Configuration
@@ -112,3 +172,80 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
     "http://127.0.0.1:5173",
 ]
+# Let the frontend read when to retry after a 429 or 503
+CORS_EXPOSE_HEADERS = ['Retry-After']
+
+# Predictions
+# Load the ML model at startup instead of on the first prediction. Enable for
+# long-running servers; leave off for management commands and tests.
+PREDICTIONS_WARM_MODEL = os.getenv('PREDICTIONS_WARM_MODEL', 'False').lower() in ('true', '1', 'yes')
+
+# Startup budget enforced by the test suite for `manage.py check`
+PREDICTIONS_STARTUP_TIME_BUDGET = float(os.getenv('PREDICTIONS_STARTUP_TIME_BUDGET', '1.5'))  # seconds
+PREDICTIONS_STARTUP_MEMORY_BUDGET = int(os.getenv('PREDICTIONS_STARTUP_MEMORY_BUDGET', '90'))  # MiB
+
+# Rate limiting: token buckets per (endpoint, session_token, client IP) and
+# per (endpoint, client IP); a request needs a token from both. Keys are URL
+# names; 'default' applies to any endpoint not listed and None disables
+# throttling for an endpoint. 'rate'/'ip_rate' are the sustained refill rates
+# and 'burst'/'ip_burst' the bucket capacities.
+PREDICTIONS_THROTTLE_RATES = {
+    'prediction-list': {
+        'rate': os.getenv('THROTTLE_CREATE_RATE', '60/min'), 'burst': 20,
+        'ip_rate': os.getenv('THROTTLE_CREATE_IP_RATE', '120/min'), 'ip_burst': 40,
+    },
+    'session-data': {
+        'rate': os.getenv('THROTTLE_READ_RATE', '120/min'), 'burst': 30,
+        'ip_rate': os.getenv('THROTTLE_READ_IP_RATE', '240/min'), 'ip_burst': 60,
+    },
+    'default': {
+        'rate': os.getenv('THROTTLE_DEFAULT_RATE', '60/min'), 'burst': 20,
+        'ip_rate': os.getenv('THROTTLE_DEFAULT_IP_RATE', '120/min'), 'ip_burst': 40,
+    },
+}
+PREDICTIONS_THROTTLE_MAX_KEYS = int(os.getenv('THROTTLE_MAX_KEYS', '10000'))
+# Buckets are kept per worker process; each process enforces this share of
+# the rates above. config/gunicorn.conf.py sets it to the number of workers.
+PREDICTIONS_THROTTLE_WORKERS = int(os.getenv('PREDICTIONS_THROTTLE_WORKERS', '1'))
+
+# Load shedding: answer 503 once this many requests (or writes) are in
+# flight in a worker process. 0 disables the check.
+PREDICTIONS_MAX_IN_FLIGHT = int(os.getenv('PREDICTIONS_MAX_IN_FLIGHT', '64'))
+PREDICTIONS_MAX_PENDING_WRITES = int(os.getenv('PREDICTIONS_MAX_PENDING_WRITES', '16'))
+PREDICTIONS_SHED_RETRY_AFTER = int(os.getenv('PREDICTIONS_SHED_RETRY_AFTER', '1'))
+
+# Response compression: bodies of at least this many bytes are sent with
+# Brotli (if the brotli package is installed) or gzip. 0 compresses everything.
+PREDICTIONS_COMPRESS_MIN_BYTES = int(os.getenv('PREDICTIONS_COMPRESS_MIN_BYTES', '1024'))
+PREDICTIONS_BROTLI_QUALITY = int(os.getenv('PREDICTIONS_BROTLI_QUALITY', '5'))
+
+# Retention: sessions with no activity for this many days are removed by
+# `manage.py purge_expired_sessions`, a batch at a time with a pause between
+# transactions.
+PREDICTIONS_RETENTION_DAYS = int(os.getenv('PREDICTIONS_RETENTION_DAYS', '90'))
+PREDICTIONS_PURGE_BATCH_SIZE = int(os.getenv('PREDICTIONS_PURGE_BATCH_SIZE', '500'))
+PREDICTIONS_PURGE_SLEEP = float(os.getenv('PREDICTIONS_PURGE_SLEEP', '0.05'))
+
+# Analytics snapshot: column files written by `manage.py snapshot_predictions`
+# and read with predictions.snapshots.PredictionSnapshot.
+PREDICTIONS_SNAPSHOT_DIR = Path(os.getenv('PREDICTIONS_SNAPSHOT_DIR', BASE_DIR / 'snapshots'))
+
+# Shadow scoring: candidate models scored in the background against the live
+# model (see predictions.shadow). Set PREDICTIONS_SHADOW_MODELS to
+# "name=dotted.path.to.factory,..."; empty disables shadow mode.
+PREDICTIONS_SHADOW_MODELS = dict(
+    item.split('=', 1) for item in os.getenv('PREDICTIONS_SHADOW_MODELS', '').split(',') if item
+)
+PREDICTIONS_SHADOW_LOG = Path(os.getenv('PREDICTIONS_SHADOW_LOG', BASE_DIR / 'shadow.jsonl'))
+PREDICTIONS_SHADOW_WORKERS = int(os.getenv('PREDICTIONS_SHADOW_WORKERS', '1'))
+PREDICTIONS_SHADOW_QUEUE_SIZE = int(os.getenv('PREDICTIONS_SHADOW_QUEUE_SIZE', '1000'))
+PREDICTIONS_SHADOW_BATCH_SIZE = int(os.getenv('PREDICTIONS_SHADOW_BATCH_SIZE', '64'))
+PREDICTIONS_SHADOW_BATCH_WAIT = float(os.getenv('PREDICTIONS_SHADOW_BATCH_WAIT', '0.05'))
+
+# Bulk CSV pricing jobs: uploads and results live in PREDICTIONS_JOBS_DIR and
+# are processed by `manage.py run_pricing_jobs`.
+PREDICTIONS_JOBS_DIR = Path(os.getenv('PREDICTIONS_JOBS_DIR', BASE_DIR / 'jobs'))
+PREDICTIONS_JOB_MAX_UPLOAD_BYTES = int(os.getenv('PREDICTIONS_JOB_MAX_UPLOAD_BYTES', str(200 * 1024 * 1024)))
+PREDICTIONS_JOB_CHUNK_SIZE = int(os.getenv('PREDICTIONS_JOB_CHUNK_SIZE', '5000'))
+PREDICTIONS_JOB_POLL_SECONDS = float(os.getenv('PREDICTIONS_JOB_POLL_SECONDS', '2'))
+PREDICTIONS_JOB_STALE_SECONDS = float(os.getenv('PREDICTIONS_JOB_STALE_SECONDS', '60'))
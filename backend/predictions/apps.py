@@ -6,9 +6,27 @@ including app metadata and default model field configuration.
 """
 
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_migrate
 
 
 class PredictionsConfig(AppConfig):
     """Configuration class for the predictions app."""
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'predictions'
+
+    def ready(self):
+        """
+        Reserve each shard's id range after migrations, and warm up the
+        prediction model when PREDICTIONS_WARM_MODEL is enabled.
+
+        Off by default so management commands and tests start without
+        importing NumPy/scikit-learn. Servers turn it on so the first request
+        does not pay for model loading.
+        """
+        from .sharding import reserve_id_range
+        post_migrate.connect(reserve_id_range, sender=self)
+
+        if getattr(settings, 'PREDICTIONS_WARM_MODEL', False):
+            from .predictor import load_model
+            load_model()
@@ -0,0 +1,266 @@
+"""
+Bulk CSV pricing jobs.
+
+An upload is streamed to `<job id>.csv` in PREDICTIONS_JOBS_DIR and a
+PricingJob row is queued. `manage.py run_pricing_jobs` claims queued jobs
+and prices them PREDICTIONS_JOB_CHUNK_SIZE rows at a time: each chunk is
+parsed, validated with the rules of PricePredictionViewSet.create using
+array operations, scored with a single model call and appended to
+`<job id>.result.csv`. Memory use is bounded by the chunk size.
+
+After every chunk the result file is fsynced and the job row records how
+far the input and the result file got. A job whose worker dies stops
+sending heartbeats (updated_at); after PREDICTIONS_JOB_STALE_SECONDS
+another worker claims it, truncates the result file to the recorded size
+and continues from the recorded input offset.
+
+The input needs a header row with `square_footage` and `bedrooms` columns
+(and optionally `name`); records must not contain quoted line breaks.
+"""
+
+import csv
+import io
+import logging
+import os
+import uuid
+from datetime import timedelta
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PricingJob
+from .predictor import predict_home_prices
+
+logger = logging.getLogger(__name__)
+
+MAX_SQUARE_FOOTAGE = 500000
+MAX_BEDROOMS = 300
+RESULT_COLUMNS = ['row', 'name', 'square_footage', 'bedrooms', 'predicted_price', 'error']
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class JobError(Exception):
+    """A problem with the uploaded file that fails the whole job."""
+
+
+def jobs_directory():
+    directory = Path(settings.PREDICTIONS_JOBS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def input_path(job):
+    return jobs_directory() / f'{job.pk}.csv'
+
+
+def result_path(job):
+    return jobs_directory() / f'{job.pk}.result.csv'
+
+
+def create_job(session_token, chunks, max_bytes=None):
+    """
+    Write the uploaded byte `chunks` to disk and queue a job for them.
+
+    The file is written under a temporary name and renamed once complete,
+    so a queued job always has its whole input. Raises UploadTooLarge when
+    the upload exceeds `max_bytes` (default PREDICTIONS_JOB_MAX_UPLOAD_BYTES).
+    """
+    max_bytes = max_bytes or settings.PREDICTIONS_JOB_MAX_UPLOAD_BYTES
+    job = PricingJob(id=uuid.uuid4(), session_token=session_token)
+    path = input_path(job)
+    partial = path.with_name(path.name + '.part')
+    size = 0
+    try:
+        with open(partial, 'wb') as f:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f'Upload exceeds {max_bytes} bytes')
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial, path)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    job.input_size = size
+    job.save()
+    return job
+
+
+def _parse(raw, dtype, convert):
+    """Convert an array of strings to `dtype`; return the values and a mask of unparseable entries."""
+    import numpy as np
+
+    try:
+        return raw.astype(dtype), np.zeros(len(raw), dtype=bool)
+    except (ValueError, OverflowError):
+        pass
+    values = np.zeros(len(raw), dtype=dtype)
+    invalid = np.zeros(len(raw), dtype=bool)
+    for i, value in enumerate(raw):
+        try:
+            values[i] = convert(value)
+        except (ValueError, OverflowError):
+            invalid[i] = True
+    return values, invalid
+
+
+def validate_features(square_footage, bedrooms):
+    """
+    Validate sequences of raw square footage and bedroom strings.
+
+    Applies the rules of PricePredictionViewSet.create to all rows at once.
+    Returns (square_footage, bedrooms, errors): float and int arrays plus an
+    array holding the first failed rule's message per row, '' for valid rows.
+    """
+    import numpy as np
+
+    square_footage_raw = np.array(square_footage, dtype=str)
+    bedrooms_raw = np.array(bedrooms, dtype=str)
+    missing = (np.char.strip(square_footage_raw) == '') | (np.char.strip(bedrooms_raw) == '')
+    square_footage, invalid_square_footage = _parse(square_footage_raw, np.float64, float)
+    bedrooms, invalid_bedrooms = _parse(bedrooms_raw, np.int64, int)
+
+    rules = [
+        (missing, 'square_footage and bedrooms are required'),
+        (invalid_square_footage | invalid_bedrooms | np.isnan(square_footage),
+         'square_footage must be a number and bedrooms must be an integer'),
+        (square_footage <= 0, 'square_footage must be greater than 0'),
+        (bedrooms <= 0, 'bedrooms must be greater than 0'),
+        (square_footage > MAX_SQUARE_FOOTAGE, 'square_footage cannot exceed 500,000'),
+        (bedrooms > MAX_BEDROOMS, 'bedrooms cannot exceed 300'),
+    ]
+    errors = np.full(len(square_footage_raw), '', dtype=object)
+    # Earlier rules take precedence, as in the view
+    for failed, message in reversed(rules):
+        errors[failed] = message
+    return square_footage, bedrooms, errors
+
+
+def _csv_bytes(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def _read_header(source):
+    """Read the header row and return the index of each known column."""
+    line = source.readline().decode('utf-8-sig', errors='replace')
+    header = [column.strip().lower() for column in next(csv.reader([line]), [])]
+    missing = [column for column in ('square_footage', 'bedrooms') if column not in header]
+    if missing:
+        raise JobError(f"CSV header is missing column(s): {', '.join(missing)}")
+    return {column: header.index(column) for column in ('square_footage', 'bedrooms', 'name') if column in header}
+
+
+def price_chunk(lines, columns, first_row=1):
+    """
+    Price one chunk of raw CSV lines.
+
+    Returns (result bytes, rows, failed rows). Blank lines are skipped.
+    """
+    import numpy as np
+
+    records = [record for record in csv.reader(line.decode('utf-8', errors='replace') for line in lines) if record]
+
+    def field(name):
+        index = columns.get(name)
+        return [record[index].strip() if index is not None and index < len(record) else '' for record in records]
+
+    square_footage_raw, bedrooms_raw, names = field('square_footage'), field('bedrooms'), field('name')
+    square_footage, bedrooms, errors = validate_features(square_footage_raw, bedrooms_raw)
+    valid = errors == ''
+    prices = np.full(len(records), np.nan)
+    if valid.any():
+        prices[valid] = predict_home_prices(np.column_stack([square_footage[valid], bedrooms[valid]]))
+
+    rows = [
+        [first_row + i, names[i], square_footage_raw[i], bedrooms_raw[i],
+         round(float(prices[i]), 2) if valid[i] else '', errors[i]]
+        for i in range(len(records))
+    ]
+    return _csv_bytes(rows), len(records), int((~valid).sum())
+
+
+def process_job(job, chunk_size=None):
+    """
+    Price a claimed job's input, resuming after its last completed chunk.
+
+    Marks the job completed, or failed with an error message when the
+    input cannot be read or parsed or pricing raises.
+    """
+    chunk_size = chunk_size or settings.PREDICTIONS_JOB_CHUNK_SIZE
+    try:
+        results = result_path(job)
+        with open(input_path(job), 'rb') as source, open(results, 'r+b' if results.exists() else 'w+b') as result:
+            columns = _read_header(source)
+            # Discard output of a chunk that was written but not recorded
+            result.truncate(job.result_size)
+            result.seek(job.result_size)
+            if not job.result_size:
+                result.write(_csv_bytes([RESULT_COLUMNS]))
+            source.seek(max(job.bytes_processed, source.tell()))
+
+            while True:
+                lines = list(islice(iter(source.readline, b''), chunk_size))
+                if not lines:
+                    break
+                data, rows, failed = price_chunk(lines, columns, first_row=job.rows_processed + 1)
+                result.write(data)
+                result.flush()
+                os.fsync(result.fileno())
+                job.bytes_processed = source.tell()
+                job.result_size = result.tell()
+                job.rows_processed += rows
+                job.rows_failed += failed
+                job.save(update_fields=['bytes_processed', 'result_size', 'rows_processed', 'rows_failed', 'updated_at'])
+    except (JobError, csv.Error, OSError) as exc:
+        job.status = PricingJob.FAILED
+        job.error = str(exc)
+    except Exception as exc:
+        logger.exception('Pricing job %s failed', job.pk)
+        job.status = PricingJob.FAILED
+        job.error = f'Unexpected error: {exc}'
+    else:
+        job.status = PricingJob.COMPLETED
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+    return job
+
+
+def claim_job(stale_seconds=None):
+    """
+    Claim the oldest queued job, or a running job whose worker stopped updating it.
+
+    Returns the claimed job or None. Claims are conditional updates, so
+    several workers never take the same job.
+    """
+    stale_seconds = settings.PREDICTIONS_JOB_STALE_SECONDS if stale_seconds is None else stale_seconds
+    stale_before = timezone.now() - timedelta(seconds=stale_seconds)
+    candidates = PricingJob.objects.filter(
+        Q(status=PricingJob.QUEUED) | Q(status=PricingJob.RUNNING, updated_at__lt=stale_before)
+    ).order_by('created_at')
+    for job in candidates[:10]:
+        claimed = PricingJob.objects.filter(pk=job.pk, status=job.status, updated_at=job.updated_at).update(
+            status=PricingJob.RUNNING, updated_at=timezone.now(),
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def run_pending_jobs(chunk_size=None, stale_seconds=None):
+    """Process jobs until none are waiting; return the number processed."""
+    processed = 0
+    while (job := claim_job(stale_seconds)) is not None:
+        process_job(job, chunk_size)
+        processed += 1
+    return processed
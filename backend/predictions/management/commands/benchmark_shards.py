@@ -0,0 +1,88 @@
+"""
+Benchmark concurrent write throughput for different shard counts.
+
+For each shard count, creates that many scratch SQLite files with the real
+predictions schema, then runs concurrent writer processes that insert one
+prediction per transaction into the shard chosen by `shard_index`, exactly
+as the API does. Prints committed rows per second for each shard count.
+
+Usage: python manage.py benchmark_shards --shards 1 2 4 8 --writers 8 --seconds 5
+"""
+
+import multiprocessing
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from predictions.models import PricePrediction
+from predictions.sharding import shard_index
+
+
+def _schema_sql():
+    """Return the CREATE TABLE/INDEX statements of the predictions table from the default database."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = %s AND sql IS NOT NULL ORDER BY type DESC",
+            [PricePrediction._meta.db_table],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _writer(args):
+    """Insert predictions until the deadline; return the number of committed rows."""
+    paths, deadline, seed = args
+    rng = random.Random(seed)
+    connections = [sqlite3.connect(path, timeout=60, isolation_level=None) for path in paths]
+    sql = (
+        f'INSERT INTO {PricePrediction._meta.db_table} '
+        '(session_token, name, square_footage, bedrooms, predicted_price, created_at, updated_at) '
+        "VALUES (?, '', ?, ?, ?, datetime('now'), datetime('now'))"
+    )
+    committed = 0
+    while time.monotonic() < deadline:
+        token = f'bench-{rng.randrange(10_000)}'
+        conn = connections[shard_index(token, len(connections))]
+        conn.execute(sql, (token, rng.uniform(500, 5000), rng.randint(1, 6), rng.uniform(1e5, 1e6)))
+        committed += 1
+    for conn in connections:
+        conn.close()
+    return committed
+
+
+class Command(BaseCommand):
+    help = 'Measure concurrent write throughput across different numbers of SQLite shards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8],
+                            help='Shard counts to compare')
+        parser.add_argument('--writers', type=int, default=8,
+                            help='Concurrent writer processes')
+        parser.add_argument('--seconds', type=float, default=5.0,
+                            help='Duration of each run')
+
+    def handle(self, *args, **options):
+        schema = _schema_sql()
+        self.stdout.write(f"writers={options['writers']} seconds={options['seconds']}")
+        self.stdout.write(f"{'shards':>7} {'rows':>9} {'rows/s':>10} {'speedup':>8}")
+        baseline = None
+        for count in options['shards']:
+            with tempfile.TemporaryDirectory(prefix='shard-bench-') as tmpdir:
+                paths = [str(Path(tmpdir) / f'shard{i}.sqlite3') for i in range(count)]
+                for path in paths:
+                    with sqlite3.connect(path) as conn:
+                        for statement in schema:
+                            conn.execute(statement)
+
+                deadline = time.monotonic() + options['seconds']
+                with multiprocessing.Pool(options['writers']) as pool:
+                    rows = sum(pool.map(_writer, [(paths, deadline, i) for i in range(options['writers'])]))
+
+            rate = rows / options['seconds']
+            baseline = baseline or rate or None
+            speedup = rate / baseline if baseline else 0
+            self.stdout.write(f'{count:>7} {rows:>9} {rate:>10.1f} {speedup:>7.2f}x')
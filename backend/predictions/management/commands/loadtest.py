@@ -0,0 +1,192 @@
+"""
+Load test for the production server.
+
+Starts the Gunicorn entry point (config/gunicorn.conf.py) against a scratch
+SQLite database, with every configured shard migrated and read replicas
+off, once per worker count, drives it with concurrent client
+processes for a fixed duration and prints throughput and latency, so the
+scaling with CPU cores can be compared side by side.
+
+Rate limiting and load shedding are switched off for the server under test,
+only 2xx responses count towards throughput, and no speedup is reported for
+a round whose error rate exceeds --max-error-rate.
+
+Usage: python manage.py loadtest --workers 1 2 4 --duration 10
+"""
+
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Rate-limit environment variables read by config/settings.py
+THROTTLE_RATE_VARIABLES = [
+    'THROTTLE_CREATE_RATE', 'THROTTLE_READ_RATE', 'THROTTLE_DEFAULT_RATE',
+    'THROTTLE_CREATE_IP_RATE', 'THROTTLE_READ_IP_RATE', 'THROTTLE_DEFAULT_IP_RATE',
+]
+UNLIMITED_RATE = '1000000000/s'
+
+
+def _free_port():
+    """Return a TCP port that is currently free on localhost."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_server(port, timeout):
+    """Block until the server accepts connections or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def _client(args):
+    """Send requests until the deadline and return the list of latencies in seconds."""
+    port, mode, deadline, client_id = args
+    token = f'loadtest-{client_id}'
+    body = json.dumps({'session_token': token, 'square_footage': 2000, 'bedrooms': 3})
+    latencies = []
+    errors = 0
+    while time.monotonic() < deadline:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        started = time.perf_counter()
+        try:
+            if mode == 'create':
+                conn.request('POST', '/api/predictions/', body,
+                             {'Content-Type': 'application/json', 'Connection': 'close'})
+            else:
+                conn.request('GET', f'/api/predictions/session-data/?session_token={token}',
+                             headers={'Connection': 'close'})
+            response = conn.getresponse()
+            response.read()
+            if 200 <= response.status < 300:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+        except OSError:
+            errors += 1
+        finally:
+            conn.close()
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = 'Measure request throughput of the Gunicorn server for different worker counts'
+
+    def add_arguments(self, parser):
+        cpus = multiprocessing.cpu_count()
+        default_workers = sorted({1, *(n for n in (2, 4, 8, 16) if n <= cpus), cpus})
+        parser.add_argument('--workers', type=int, nargs='+', default=default_workers,
+                            help='Worker counts to test (default: powers of two up to the CPU count)')
+        parser.add_argument('--clients', type=int, default=cpus * 4,
+                            help='Concurrent client processes (default: 4 per CPU)')
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help='Seconds to run each worker count')
+        parser.add_argument('--mode', choices=['create', 'read'], default='create',
+                            help='create: POST predictions; read: GET session-data')
+        parser.add_argument('--threads', type=int, default=1, help='Threads per worker')
+        parser.add_argument('--max-error-rate', type=float, default=0.01,
+                            help='Largest share of failed requests for which a speedup is reported')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory(prefix='loadtest-') as tmpdir:
+            env = dict(
+                os.environ,
+                DATABASE_NAME=str(Path(tmpdir) / 'loadtest.sqlite3'),
+                DEBUG='False',
+                ALLOWED_HOSTS='127.0.0.1,localhost',
+                GUNICORN_THREADS=str(options['threads']),
+                GUNICORN_ACCESSLOG='',
+                # Measure the server, not the abuse protection
+                **{name: UNLIMITED_RATE for name in THROTTLE_RATE_VARIABLES},
+                PREDICTIONS_MAX_IN_FLIGHT='0',
+                PREDICTIONS_MAX_PENDING_WRITES='0',
+                # Nothing refreshes replicas during the run
+                PREDICTIONS_REPLICAS_ENABLED='False',
+            )
+            # Every configured shard of the scratch database needs the schema
+            subprocess.run([sys.executable, 'manage.py', 'migrate_shards', '-v', '0'],
+                           cwd=settings.BASE_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+            self.stdout.write(
+                f"mode={options['mode']} clients={options['clients']} "
+                f"duration={options['duration']}s cpus={multiprocessing.cpu_count()}"
+            )
+            self.stdout.write(f"{'workers':>8} {'requests':>9} {'errors':>7} {'req/s':>9} "
+                              f"{'p50 ms':>8} {'p95 ms':>8} {'speedup':>8}")
+            baseline = None
+            unreliable = False
+            for i, workers in enumerate(options['workers']):
+                result = self.run_round(env, workers, options)
+                attempts = result['requests'] + result['errors']
+                error_rate = result['errors'] / attempts if attempts else 1
+                reliable = error_rate <= options['max_error_rate'] and result['requests'] > 0
+                if i == 0 and reliable:
+                    baseline = result['rps']
+                if baseline and reliable:
+                    speedup = f"{result['rps'] / baseline:>7.2f}x"
+                else:
+                    speedup = f"{'-':>8}"
+                    unreliable = True
+                self.stdout.write(
+                    f"{workers:>8} {result['requests']:>9} {result['errors']:>7} {result['rps']:>9.1f} "
+                    f"{result['p50']:>8.1f} {result['p95']:>8.1f} {speedup}"
+                )
+            if unreliable:
+                self.stderr.write(
+                    f"Speedup not reported where more than {options['max_error_rate']:.0%} of requests "
+                    'failed (or the first round failed); the measurement does not reflect server capacity.'
+                )
+
+    def run_round(self, env, workers, options):
+        """Start a server with the given worker count, load it and stop it."""
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'config/gunicorn.conf.py', 'config.wsgi'],
+            cwd=settings.BASE_DIR,
+            env=dict(env, GUNICORN_WORKERS=str(workers), GUNICORN_BIND=f'127.0.0.1:{port}'),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            if not _wait_for_server(port, timeout=30):
+                raise CommandError(f'Gunicorn with {workers} workers did not start')
+            # Give every worker time to boot before the clock starts
+            time.sleep(1)
+            deadline = time.monotonic() + options['duration']
+            with multiprocessing.Pool(options['clients']) as pool:
+                results = pool.map(_client, [
+                    (port, options['mode'], deadline, i) for i in range(options['clients'])
+                ])
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+
+        latencies = sorted(latency for client_latencies, _ in results for latency in client_latencies)
+        errors = sum(client_errors for _, client_errors in results)
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': len(latencies) / options['duration'],
+            'p50': statistics.median(latencies) * 1000 if latencies else 0,
+            'p95': p95 * 1000,
+        }
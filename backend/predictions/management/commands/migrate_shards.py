@@ -0,0 +1,20 @@
+"""
+Apply migrations to 'default' and every configured prediction shard.
+
+Usage: python manage.py migrate_shards
+"""
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from predictions.sharding import configured_shard_aliases
+
+
+class Command(BaseCommand):
+    help = 'Run migrate on the default database and on every prediction shard'
+
+    def handle(self, *args, **options):
+        for alias in configured_shard_aliases():
+            self.stdout.write(f'Migrating {alias}...')
+            call_command('migrate', database=alias, interactive=False,
+                         verbosity=options['verbosity'], stdout=self.stdout)
@@ -0,0 +1,77 @@
+"""
+Delete sessions that have been inactive for longer than the retention period.
+
+Usage:
+    python manage.py purge_expired_sessions                  # PREDICTIONS_RETENTION_DAYS
+    python manage.py purge_expired_sessions --days 30 --batch-size 200 --sleep 0.1
+    python manage.py purge_expired_sessions --dry-run
+    python manage.py purge_expired_sessions --enable-incremental-vacuum   # one-off, blocks writers
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from predictions.retention import (
+    enable_incremental_vacuum,
+    expired_sessions,
+    incremental_vacuum,
+    purge_expired_sessions,
+    retention_cutoff,
+    sqlite_auto_vacuum_mode,
+)
+from predictions.sharding import configured_shard_aliases
+
+
+class Command(BaseCommand):
+    help = 'Purge predictions of sessions inactive for longer than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.PREDICTIONS_RETENTION_DAYS,
+                            help='Retention period in days since the last activity of a session')
+        parser.add_argument('--batch-size', type=int, default=settings.PREDICTIONS_PURGE_BATCH_SIZE,
+                            help='Predictions deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=settings.PREDICTIONS_PURGE_SLEEP,
+                            help='Seconds to pause between transactions')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what would be deleted')
+        parser.add_argument('--no-vacuum', action='store_true',
+                            help='Skip the incremental vacuum after purging')
+        parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                            help='Switch SQLite to incremental auto-vacuum (runs a full VACUUM once)')
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff(options['days'])
+        for alias in configured_shard_aliases():
+            self.purge_shard(alias, cutoff, options)
+
+    def purge_shard(self, alias, cutoff, options):
+        """Purge expired sessions from one shard and reclaim its free pages."""
+        if options['enable_incremental_vacuum']:
+            self.stdout.write(f'[{alias}] Running a full VACUUM to enable incremental auto-vacuum...')
+            enable_incremental_vacuum(alias)
+
+        if options['dry_run']:
+            expired = expired_sessions(cutoff, alias)
+            rows = expired.aggregate(rows=Sum('prediction_count'))['rows'] or 0
+            self.stdout.write(f'[{alias}] Would purge {expired.count()} sessions ({rows} predictions) '
+                              f'inactive since {cutoff.isoformat()}')
+            return
+
+        sessions, rows = purge_expired_sessions(
+            cutoff, batch_size=options['batch_size'], pause=options['sleep'], using=alias
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'[{alias}] Purged {sessions} sessions ({rows} predictions) inactive since {cutoff.isoformat()}'
+        ))
+
+        if options['no_vacuum']:
+            return
+        released = incremental_vacuum(pause=options['sleep'], using=alias)
+        if released is not None:
+            self.stdout.write(f'[{alias}] Incremental vacuum released {released} pages')
+        elif sqlite_auto_vacuum_mode(alias) is not None:
+            self.stdout.write(self.style.WARNING(
+                f'[{alias}] SQLite auto_vacuum is not INCREMENTAL, so freed pages stay in the file; '
+                'run once with --enable-incremental-vacuum to reclaim space'
+            ))
@@ -0,0 +1,126 @@
+"""
+Move sessions to the shard PREDICTIONS_SHARD_COUNT assigns them to.
+
+Run after changing PREDICTIONS_SHARD_COUNT (and migrate_shards). When
+shrinking, keep the retired shards configured with
+PREDICTIONS_SHARD_DATABASES=<old count> until this command has emptied them.
+
+Usage:
+    python manage.py rebalance_shards --dry-run
+    python manage.py rebalance_shards --batch-size 500 --sleep 0.05
+
+Each session is copied to its new shard and deleted from the old one in
+batches. A row whose column values (everything but the id) match a row
+already on the target is skipped once per match, so an interrupted run can
+simply be restarted without duplicating the batch it copied last. Moved
+rows get new ids from the target shard's range.
+"""
+
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from predictions.models import PricePrediction
+from predictions.rollups import refresh_session_summary
+from predictions.sharding import configured_shard_aliases, shard_for
+
+
+FIELDS = [field for field in PricePrediction._meta.concrete_fields if not field.primary_key]
+
+
+def _row_key(row):
+    """Return the values that identify a prediction independently of its shard's id."""
+    return tuple(getattr(row, field.attname) for field in FIELDS)
+
+
+def _insert_rows(rows, using):
+    """Insert prediction rows on `using` preserving every column except the id."""
+    connection = connections[using]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(PricePrediction._meta.db_table),
+        ', '.join(connection.ops.quote_name(field.column) for field in FIELDS),
+        ', '.join(['%s'] * len(FIELDS)),
+    )
+    params = [
+        [field.get_db_prep_save(getattr(row, field.attname), connection) for field in FIELDS]
+        for row in rows
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def move_session(session_token, source, target, batch_size=500, pause=0.0):
+    """
+    Move one session's predictions and rollup from `source` to `target`.
+
+    Returns the number of rows inserted on the target; rows already copied
+    by an earlier interrupted run are deleted from the source but not counted.
+    """
+    existing = Counter(
+        _row_key(row) for row in PricePrediction.objects.using(target).filter(session_token=session_token)
+    )
+    rows = PricePrediction.objects.using(source).filter(session_token=session_token).order_by('id')
+    moved = 0
+    last_id = 0
+    while True:
+        batch = list(rows.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        missing = []
+        for row in batch:
+            key = _row_key(row)
+            if existing[key]:
+                existing[key] -= 1
+            else:
+                missing.append(row)
+        with transaction.atomic(using=target):
+            _insert_rows(missing, target)
+        with transaction.atomic(using=source):
+            PricePrediction.objects.using(source).filter(id__in=[row.id for row in batch]).delete()
+        moved += len(missing)
+        time.sleep(pause)
+
+    with transaction.atomic(using=target):
+        refresh_session_summary(session_token, target)
+    with transaction.atomic(using=source):
+        refresh_session_summary(session_token, source)
+    return moved
+
+
+class Command(BaseCommand):
+    help = 'Move sessions whose shard changed after PREDICTIONS_SHARD_COUNT was changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Predictions copied and deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0.05,
+                            help='Seconds to pause between batches')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many sessions would move')
+
+    def handle(self, *args, **options):
+        total_sessions = 0
+        total_rows = 0
+        for source in configured_shard_aliases():
+            tokens = (
+                PricePrediction.objects.using(source)
+                .order_by()
+                .values_list('session_token', flat=True)
+                .distinct()
+            )
+            misplaced = [token for token in tokens.iterator() if shard_for(token) != source]
+            for token in misplaced:
+                target = shard_for(token)
+                if options['dry_run']:
+                    rows = PricePrediction.objects.using(source).filter(session_token=token).count()
+                else:
+                    rows = move_session(token, source, target, options['batch_size'], options['sleep'])
+                total_rows += rows
+            total_sessions += len(misplaced)
+            self.stdout.write(f'{source}: {len(misplaced)} sessions to move')
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {total_sessions} sessions ({total_rows} predictions)'))
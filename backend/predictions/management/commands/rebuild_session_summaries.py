@@ -0,0 +1,33 @@
+"""
+Rebuild or verify the SessionSummary rollup.
+
+Usage:
+    python manage.py rebuild_session_summaries           # rebuild from scratch
+    python manage.py rebuild_session_summaries --check   # report drift, exit 1 if any
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from predictions.rollups import find_summary_drift, rebuild_session_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-session rollup from the predictions table, or check it for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only compare the rollup with the predictions table')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = find_summary_drift()
+            for session_token, field, stored, expected in drift:
+                self.stdout.write(f'{session_token}: {field} is {stored}, expected {expected}')
+            if drift:
+                raise CommandError(f'{len(drift)} rollup value(s) have drifted; '
+                                   'run rebuild_session_summaries to repair them')
+            self.stdout.write(self.style.SUCCESS('Session summaries are consistent'))
+            return
+
+        count = rebuild_session_summaries()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} session summaries'))
@@ -0,0 +1,43 @@
+"""
+Refresh the read replica of every shard from its primary.
+
+Usage:
+    python manage.py refresh_replicas                 # refresh once
+    python manage.py refresh_replicas --loop          # every PREDICTIONS_REPLICA_REFRESH_SECONDS
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictions.replicas import refresh_replica, replica_alias
+from predictions.sharding import configured_shard_aliases
+
+
+class Command(BaseCommand):
+    help = 'Copy each shard to its read replica with the SQLite online backup API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep refreshing until interrupted')
+        parser.add_argument('--interval', type=float, default=settings.PREDICTIONS_REPLICA_REFRESH_SECONDS,
+                            help='Seconds between refreshes with --loop')
+        parser.add_argument('--pages', type=int, default=-1,
+                            help='Pages copied per backup step (-1 copies everything in one step)')
+
+    def handle(self, *args, **options):
+        primaries = [alias for alias in configured_shard_aliases() if replica_alias(alias)]
+        if not primaries:
+            raise CommandError('No replicas are configured; set PREDICTIONS_REPLICAS_ENABLED=True')
+
+        while True:
+            for primary in primaries:
+                started = time.monotonic()
+                refresh_replica(primary, pages=options['pages'])
+                self.stdout.write(
+                    f'{primary} -> {replica_alias(primary)} in {(time.monotonic() - started) * 1000:.0f} ms'
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
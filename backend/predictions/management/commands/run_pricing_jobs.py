@@ -0,0 +1,45 @@
+"""
+Process queued bulk CSV pricing jobs.
+
+Usage:
+    python manage.py run_pricing_jobs            # process waiting jobs, then exit
+    python manage.py run_pricing_jobs --loop     # keep polling every PREDICTIONS_JOB_POLL_SECONDS
+
+Several workers can run at once; each job is claimed by one of them. Jobs
+left running by a worker that died are resumed once they are
+PREDICTIONS_JOB_STALE_SECONDS old.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from predictions.jobs import claim_job, process_job
+
+
+class Command(BaseCommand):
+    help = 'Price uploaded CSV files in the background'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new jobs until interrupted')
+        parser.add_argument('--interval', type=float, default=settings.PREDICTIONS_JOB_POLL_SECONDS,
+                            help='Seconds between polls with --loop')
+        parser.add_argument('--chunk-size', type=int, default=settings.PREDICTIONS_JOB_CHUNK_SIZE,
+                            help='Rows validated and scored per step')
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_job()
+            if job is None:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            started = time.monotonic()
+            process_job(job, options['chunk_size'])
+            self.stdout.write(
+                f'{job.pk}: {job.status}, {job.rows_processed} rows ({job.rows_failed} invalid) '
+                f'in {time.monotonic() - started:.1f}s'
+            )
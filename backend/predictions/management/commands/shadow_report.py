@@ -0,0 +1,57 @@
+"""
+Summarize the shadow scoring log per candidate model.
+
+Usage: python manage.py shadow_report [--log shadow.jsonl]
+
+For each candidate prints the number of inputs scored, the mean and 95th
+percentile absolute difference from the live model, the mean relative
+difference and the largest difference, followed by the number of inputs
+dropped because the shadow queue was full.
+"""
+
+import json
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Compare candidate models with the live model using the shadow scoring log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=None,
+                            help='Shadow log to read (default: PREDICTIONS_SHADOW_LOG)')
+
+    def handle(self, *args, **options):
+        path = options['log'] or settings.PREDICTIONS_SHADOW_LOG
+        candidates = {}
+        scored = 0
+        dropped = 0
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    dropped += record['dropped']
+                    for name, prices in record['candidates'].items():
+                        candidates.setdefault(name, ([], []))
+                        candidates[name][0].extend(record['primary'])
+                        candidates[name][1].extend(prices)
+                    scored += len(record['primary'])
+        except FileNotFoundError:
+            raise CommandError(f'No shadow log at {path}')
+
+        self.stdout.write(f"{'model':<20} {'inputs':>8} {'mean |diff|':>12} {'p95 |diff|':>12} "
+                          f"{'mean |diff|%':>12} {'max |diff|':>12}")
+        for name, (live, shadow) in sorted(candidates.items()):
+            live = np.asarray(live)
+            diff = np.abs(np.asarray(shadow) - live)
+            relative = diff / np.where(live == 0, np.nan, live)
+            self.stdout.write(
+                f'{name:<20} {len(diff):>8} {diff.mean():>12.2f} {np.percentile(diff, 95):>12.2f} '
+                f'{np.nanmean(relative) * 100 if np.isfinite(relative).any() else 0:>11.2f}% {diff.max():>12.2f}'
+            )
+        self.stdout.write(f'{scored} inputs shadow scored, {dropped} dropped')
@@ -0,0 +1,36 @@
+"""
+Append new predictions to the columnar analytics snapshot.
+
+Usage:
+    python manage.py snapshot_predictions              # append rows added since the last run
+    python manage.py snapshot_predictions --rebuild    # start over (after rebalance_shards or to drop deleted rows)
+
+Query the snapshot with predictions.snapshots.PredictionSnapshot.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from predictions.snapshots import DEFAULT_CHUNK_SIZE, PredictionSnapshot, snapshot_directory, update_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write predictions to memory-mappable column files for analytics scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None,
+                            help='Snapshot directory (default: PREDICTIONS_SNAPSHOT_DIR)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Rows read and appended per step')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Discard the existing snapshot and copy every row')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        appended = update_snapshot(options['dir'], chunk_size=options['chunk_size'], rebuild=options['rebuild'])
+        total = len(PredictionSnapshot(options['dir']))
+        self.stdout.write(
+            f'Appended {appended} predictions in {time.monotonic() - started:.2f}s; '
+            f'{total} rows in {snapshot_directory(options["dir"])}'
+        )
@@ -0,0 +1,110 @@
+"""
+Middleware for the predictions app.
+
+LoadSheddingMiddleware rejects requests with 503 Service Unavailable when the
+process already has too many requests, or too many database writes, in
+flight, so that a burst cannot queue up behind SQLite's single writer lock
+and drive latency up for everyone.
+
+CompressionMiddleware compresses response bodies of at least
+PREDICTIONS_COMPRESS_MIN_BYTES with Brotli when the client accepts it and
+the optional `brotli` package is installed, and with gzip otherwise.
+"""
+
+import re
+import threading
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+_WRITE_METHODS = frozenset({'POST', 'PUT', 'PATCH', 'DELETE'})
+_ACCEPTS_BROTLI = re.compile(r'\bbr\b')
+_ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+_COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/vnd.columnar+json', 'application/msgpack')
+
+
+class LoadSheddingMiddleware:
+    """Shed load once in-flight requests or pending writes pass their thresholds."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_in_flight = getattr(settings, 'PREDICTIONS_MAX_IN_FLIGHT', 0)
+        self.max_pending_writes = getattr(settings, 'PREDICTIONS_MAX_PENDING_WRITES', 0)
+        self.retry_after = getattr(settings, 'PREDICTIONS_SHED_RETRY_AFTER', 1)
+        self.in_flight = 0
+        self.pending_writes = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        is_write = request.method in _WRITE_METHODS
+        with self._lock:
+            if (self.max_in_flight and self.in_flight >= self.max_in_flight) or (
+                is_write and self.max_pending_writes and self.pending_writes >= self.max_pending_writes
+            ):
+                return self.shed()
+            self.in_flight += 1
+            if is_write:
+                self.pending_writes += 1
+
+        try:
+            return self.get_response(request)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                if is_write:
+                    self.pending_writes -= 1
+
+    def shed(self):
+        """Build the 503 response returned when the server is overloaded."""
+        response = JsonResponse(
+            {'error': 'Server is busy, please retry shortly'},
+            status=503,
+        )
+        response['Retry-After'] = str(self.retry_after)
+        return response
+
+
+class CompressionMiddleware:
+    """Compress large responses with Brotli or gzip, whichever the client accepts."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_bytes = getattr(settings, 'PREDICTIONS_COMPRESS_MIN_BYTES', 1024)
+        self.brotli_quality = getattr(settings, 'PREDICTIONS_BROTLI_QUALITY', 5)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < self.min_bytes
+            or not response.get('Content-Type', '').startswith(_COMPRESSIBLE_TYPES)
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and _ACCEPTS_BROTLI.search(accept_encoding):
+            encoding, content = 'br', brotli.compress(response.content, quality=self.brotli_quality)
+        elif _ACCEPTS_GZIP.search(accept_encoding):
+            encoding, content = 'gzip', compress_string(response.content)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        # The compressed body differs from the uncompressed one
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:54
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def backfill_session_summaries(apps, schema_editor):
+    PricePrediction = apps.get_model('predictions', 'PricePrediction')
+    SessionSummary = apps.get_model('predictions', 'SessionSummary')
+    db_alias = schema_editor.connection.alias
+    rows = (
+        PricePrediction.objects.using(db_alias)
+        .order_by()
+        .values('session_token')
+        .annotate(
+            prediction_count=Count('id'),
+            price_sum=Sum('predicted_price'),
+            price_min=Min('predicted_price'),
+            price_max=Max('predicted_price'),
+            last_activity=Max('updated_at'),
+        )
+    )
+    SessionSummary.objects.using(db_alias).bulk_create(
+        (SessionSummary(**row) for row in rows.iterator()), batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0003_priceprediction_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionSummary',
+            fields=[
+                ('session_token', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('prediction_count', models.PositiveIntegerField(default=0)),
+                ('price_sum', models.FloatField(default=0)),
+                ('price_min', models.FloatField(null=True)),
+                ('price_max', models.FloatField(null=True)),
+                ('last_activity', models.DateTimeField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='priceprediction',
+            name='session_token',
+            field=models.CharField(db_index=True, default='', max_length=255),
+        ),
+        migrations.RunPython(backfill_session_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0004_sessionsummary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sessionsummary',
+            name='last_activity',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -3,15 +3,19 @@ Database models for home price predictions.
 
 This module defines the PricePrediction model which stores historical
 home price predictions with their input features (square footage, bedrooms)
-and the predicted price values.
+and the predicted price values, the SessionSummary rollup that keeps
+per-session aggregates of those predictions up to date, and PricingJob for
+bulk CSV pricing.
 """
 
+import uuid
+
 from django.db import models
 
 
 class PricePrediction(models.Model):
     """Model to store home price predictions."""
-    session_token = models.CharField(max_length=255, default='')
+    session_token = models.CharField(max_length=255, default='', db_index=True)
     name = models.CharField(max_length=255, blank=True, default='')
     square_footage = models.FloatField()
     bedrooms = models.IntegerField()
@@ -24,3 +28,75 @@ class PricePrediction(models.Model):
 
     def __str__(self):
         return f"Prediction: {self.square_footage} sqft, {self.bedrooms} bed - ${self.predicted_price}"
+
+
+class SessionSummary(models.Model):
+    """
+    Per-session rollup of PricePrediction rows.
+
+    Maintained in the same transaction as every create, update and delete
+    (see predictions.rollups) so that session statistics are a primary-key
+    lookup instead of an aggregate over the predictions table.
+    """
+    session_token = models.CharField(max_length=255, primary_key=True)
+    prediction_count = models.PositiveIntegerField(default=0)
+    price_sum = models.FloatField(default=0)
+    price_min = models.FloatField(null=True)
+    price_max = models.FloatField(null=True)
+    last_activity = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Summary: {self.session_token} ({self.prediction_count} predictions)"
+
+    @property
+    def price_mean(self):
+        if not self.prediction_count:
+            return None
+        return self.price_sum / self.prediction_count
+
+
+class PricingJob(models.Model):
+    """
+    A bulk pricing job for an uploaded CSV file.
+
+    The upload and the result are files in PREDICTIONS_JOBS_DIR named after
+    the job id; the row records progress so a restarted worker can resume
+    the job after the last completed chunk (see predictions.jobs).
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    session_token = models.CharField(max_length=255, db_index=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    input_size = models.PositiveBigIntegerField(default=0)
+    bytes_processed = models.PositiveBigIntegerField(default=0)
+    result_size = models.PositiveBigIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"Pricing job {self.id} ({self.status})"
+
+    @property
+    def progress(self):
+        if self.status == self.COMPLETED:
+            return 1.0
+        if not self.input_size:
+            return 0.0
+        return min(1.0, self.bytes_processed / self.input_size)
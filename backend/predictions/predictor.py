@@ -1,13 +1,19 @@
 """
 Home price prediction using Linear Regression.
 Model trained on historical housing data with square footage and bedrooms as features.
+
+NumPy and scikit-learn are imported, and the model is fitted, on first use
+rather than at import time, so management commands and workers that never
+predict do not pay for them. Servers can opt in to loading the model up
+front via ``load_model()`` (see ``PredictionsConfig.ready``).
+
+Every prediction is also handed to the shadow scorer (see ``shadow.py``),
+which is a no-op unless candidate models are configured.
 """
 
-import numpy as np
-from sklearn.linear_model import LinearRegression
+import threading
 
-import pickle
-import os
+from .shadow import submit_shadow
 
 # Training data: List of dictionaries with provided housing data
 training_data = [
@@ -21,25 +27,54 @@ training_data = [
     {'sq_footage': 2600, 'bedrooms': 5, 'price': 400000},
 ]
 
-# Extract features and target from training data
-X_train = np.array([[data['sq_footage'], data['bedrooms']] for data in training_data])
-y_train = np.array([data['price'] for data in training_data])
+_model = None
+_model_lock = threading.Lock()
+
+
+def _train_model():
+    """Fit the Linear Regression model on the training data."""
+    import numpy as np
+    from sklearn.linear_model import LinearRegression
+
+    # Extract features and target from training data
+    X_train = np.array([[data['sq_footage'], data['bedrooms']] for data in training_data])
+    y_train = np.array([data['price'] for data in training_data])
+
+    # Train the Linear Regression model
+    model = LinearRegression()
+    model.fit(X_train, y_train)
+    return model
+
+
+def load_model():
+    """
+    Return the fitted model, training it on the first call.
+
+    Safe to call from several threads; the model is only fitted once per process.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = _train_model()
+    return _model
 
-# Train the Linear Regression model
-_model = LinearRegression()
-_model.fit(X_train, y_train)
+
+def is_model_loaded() -> bool:
+    """Return True if the model has already been fitted in this process."""
+    return _model is not None
 
 
 def predict_home_price(square_footage: float, bedrooms: int) -> float:
     """
     Predict home price using Linear Regression model trained on historical data.
-    
+
     Model features:
     - Square footage of the home
     - Number of bedrooms
-    
+
     Trained on 8 historical housing transactions.
-    
+
     Args:
         square_footage: The square footage of the home
         bedrooms: The number of bedrooms
@@ -47,11 +82,35 @@ def predict_home_price(square_footage: float, bedrooms: int) -> float:
     Returns:
         Predicted price as a float
     """
+    import numpy as np
+
     # Prepare features for prediction
     features = np.array([[square_footage, bedrooms]])
-    
+
     # Make prediction with LinearRegression model
-    predicted_price = _model.predict(features)[0]
-    
+    predicted_price = load_model().predict(features)[0]
+
     # Ensure price is non-negative
-    return max(0, float(predicted_price))
+    price = max(0, float(predicted_price))
+
+    # Compare candidate models on the same inputs in the background
+    submit_shadow(square_footage, bedrooms, price)
+    return price
+
+
+def predict_home_prices(features):
+    """
+    Predict prices for many homes with one model call.
+
+    Args:
+        features: Array-like of shape (n, 2) with square footage and bedrooms per row
+
+    Returns:
+        NumPy array of n non-negative predicted prices
+    """
+    import numpy as np
+
+    features = np.asarray(features, dtype=float).reshape(-1, 2)
+    if not len(features):
+        return np.empty(0)
+    return np.maximum(load_model().predict(features), 0)
@@ -0,0 +1,62 @@
+"""
+Compact renderers for lists of predictions.
+
+ColumnarJSONRenderer sends a list of objects as one array per field, so
+field names appear once instead of on every row:
+
+    {"count": 2, "columns": {"id": [1, 2], "predicted_price": [...]}}
+
+MessagePackRenderer sends the usual rows as MessagePack. It is only
+available when the optional `msgpack` package is installed.
+
+Both are chosen by content negotiation (Accept header) or `?format=`.
+Anything other than a list of objects, such as an error, is rendered as
+the plain structure.
+"""
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+
+def to_columns(data):
+    """Turn a list of dicts into {'count', 'columns'}; other data is returned unchanged."""
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        return data
+    names = list(data[0]) if data else []
+    return {
+        'count': len(data),
+        'columns': {name: [row.get(name) for row in data] for name in names},
+    }
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(to_columns(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True)
+
+
+def compact_renderer_classes():
+    """Renderers offered by list endpoints: JSON first, then the compact encodings available."""
+    from rest_framework.settings import api_settings
+
+    compact = [ColumnarJSONRenderer] + ([MessagePackRenderer] if msgpack is not None else [])
+    default = list(api_settings.DEFAULT_RENDERER_CLASSES)
+    return default[:1] + compact + default[1:]
@@ -0,0 +1,122 @@
+"""
+Read replicas for session history reads.
+
+When PREDICTIONS_REPLICAS_ENABLED is set, every shard '<alias>' has a
+read-only copy 'replica_<alias>' that `manage.py refresh_replicas` keeps
+up to date with SQLite's online backup API. History and summary reads go
+to the replica so they do not compete with write transactions on the
+primary file; creates, updates and deletes always go to the primary.
+
+A session reads its own writes: each write records its time in a pin, and
+the session reads from the primary until its replica holds a refresh
+started after that time. Reads also fall back to the primary when the
+replica file is missing or has not been refreshed for
+PREDICTIONS_REPLICA_MAX_LAG seconds, so a pin is kept for that long; after
+it expires any replica still in use was refreshed after the write.
+"""
+
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+from .sharding import shard_for
+
+REPLICA_ALIAS_PREFIX = 'replica_'
+PIN_CACHE_ALIAS = 'replica_pins'
+
+
+def is_replica_alias(alias):
+    return alias.startswith(REPLICA_ALIAS_PREFIX)
+
+
+def replica_alias(primary):
+    """Return the replica alias of a primary database alias, or None if it has none."""
+    alias = f'{REPLICA_ALIAS_PREFIX}{primary}'
+    return alias if alias in connections.databases else None
+
+
+def primary_alias(alias):
+    """Return the primary alias for a replica alias; other aliases are returned unchanged."""
+    return alias[len(REPLICA_ALIAS_PREFIX):] if is_replica_alias(alias) else alias
+
+
+def _pin_key(session_token):
+    return f'primary-pin:{session_token}'
+
+
+def pin_to_primary(session_token):
+    """Send the session's reads to the primary until a replica refresh includes this write."""
+    if getattr(settings, 'PREDICTIONS_REPLICAS_ENABLED', False):
+        caches[PIN_CACHE_ALIAS].set(
+            _pin_key(session_token), time.time(), timeout=settings.PREDICTIONS_REPLICA_MAX_LAG
+        )
+
+
+def replica_is_current(alias, written_at=None):
+    """
+    Return True if the replica file exists and was refreshed within the maximum lag.
+
+    With `written_at` the refresh must also have started after that time.
+    """
+    try:
+        refreshed_at = os.path.getmtime(connections.databases[alias]['NAME'])
+    except OSError:
+        return False
+    if written_at is not None and refreshed_at <= written_at:
+        return False
+    return time.time() - refreshed_at <= settings.PREDICTIONS_REPLICA_MAX_LAG
+
+
+def read_alias_for_shard(primary, written_at=None):
+    """Return the alias to read a shard from: its replica when usable, otherwise the primary."""
+    replica = replica_alias(primary)
+    if replica and replica_is_current(replica, written_at):
+        return replica
+    return primary
+
+
+def read_alias(session_token):
+    """Return the alias to read a session's rows from."""
+    primary = shard_for(session_token)
+    if not getattr(settings, 'PREDICTIONS_REPLICAS_ENABLED', False):
+        return primary
+    return read_alias_for_shard(primary, caches[PIN_CACHE_ALIAS].get(_pin_key(session_token)))
+
+
+def refresh_replica(primary, pages=-1):
+    """
+    Copy a primary SQLite database to its replica file.
+
+    The copy is made with the online backup API into a temporary file next
+    to the replica and then atomically renamed over it, so readers never
+    see a partial copy. The replica's mtime is set to the time the backup
+    started, which is what the maximum lag is measured against.
+    """
+    replica = replica_alias(primary)
+    if replica is None:
+        return False
+    source_path = str(connections.databases[primary]['NAME'])
+    target_path = str(connections.databases[replica]['NAME'])
+    started = time.time()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target_path) or '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(target, pages=pages)
+        finally:
+            target.close()
+            source.close()
+        os.utime(tmp_path, (started, started))
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return True
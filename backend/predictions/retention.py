@@ -0,0 +1,134 @@
+"""
+Retention policy for abandoned sessions.
+
+Session tokens are generated by the browser and rows are only removed when
+a user deletes them, so sessions that are never used again would otherwise
+stay in the predictions table forever. A session expires once its
+SessionSummary.last_activity is older than PREDICTIONS_RETENTION_DAYS.
+
+Expired rows are deleted in small primary-key batches, each a single DELETE
+statement with a pause in between, so the purge never holds SQLite's write
+lock long enough to stall live requests, and waits for the lock instead of
+failing when a request commits a write in the middle of a batch. Every
+function works on one shard, given by `using`.
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Subquery
+from django.utils import timezone
+
+from .models import PricePrediction, SessionSummary
+from .rollups import refresh_session_summary
+
+
+def retention_cutoff(days=None):
+    """Return the last-activity time before which a session is expired."""
+    if days is None:
+        days = settings.PREDICTIONS_RETENTION_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def expired_sessions(cutoff, using='default'):
+    """Return a queryset of SessionSummary rows whose last activity is before `cutoff`."""
+    return SessionSummary.objects.using(using).filter(last_activity__lt=cutoff)
+
+
+def purge_expired_sessions(cutoff, batch_size=500, pause=0.05, sessions_per_batch=100, using='default'):
+    """
+    Delete every prediction, and the rollup, of sessions inactive since `cutoff`.
+
+    Each batch is one DELETE of at most `batch_size` predictions whose
+    session is still expired when the statement runs, followed by a `pause`
+    second sleep. A session that becomes active again while it is being
+    purged keeps its remaining rows and has its rollup recomputed.
+
+    Returns (sessions purged, predictions deleted).
+    """
+    sessions_purged = 0
+    rows_deleted = 0
+    while True:
+        tokens = list(
+            expired_sessions(cutoff, using).order_by('last_activity').values_list('pk', flat=True)[:sessions_per_batch]
+        )
+        if not tokens:
+            break
+
+        still_expired = expired_sessions(cutoff, using).filter(pk__in=tokens).values('pk')
+        batch = (
+            PricePrediction.objects.using(using).filter(session_token__in=still_expired)
+            .order_by()
+            .values('id')[:batch_size]
+        )
+        while True:
+            # One statement, so it starts by taking the write lock; reading the
+            # ids in an earlier statement of the same transaction would make the
+            # DELETE fail when another connection commits in between
+            deleted, _ = PricePrediction.objects.using(using).filter(id__in=Subquery(batch)).delete()
+            if not deleted:
+                break
+            rows_deleted += deleted
+            time.sleep(pause)
+
+        with transaction.atomic(using=using):
+            purged, _ = expired_sessions(cutoff, using).filter(pk__in=tokens).delete()
+            sessions_purged += purged
+            if purged < len(tokens):
+                # Sessions that were used again mid-purge
+                for token in SessionSummary.objects.using(using).filter(pk__in=tokens).values_list('pk', flat=True):
+                    refresh_session_summary(token, using)
+        time.sleep(pause)
+
+    return sessions_purged, rows_deleted
+
+
+def sqlite_auto_vacuum_mode(using='default'):
+    """Return SQLite's auto_vacuum mode (0 none, 1 full, 2 incremental), or None for other databases."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA auto_vacuum')
+        return cursor.fetchone()[0]
+
+
+def enable_incremental_vacuum(using='default'):
+    """
+    Switch the SQLite database to incremental auto-vacuum.
+
+    The mode only takes effect after a full VACUUM, which rewrites the whole
+    file and blocks writers while it runs, so this is a one-off operation.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute('VACUUM')
+
+
+def incremental_vacuum(pages_per_step=1000, pause=0.05, using='default'):
+    """
+    Return free pages to the filesystem a few at a time.
+
+    Returns the number of pages released, or None when the database is not
+    SQLite in incremental auto-vacuum mode.
+    """
+    if sqlite_auto_vacuum_mode(using) != 2:
+        return None
+    connection = connections[using]
+    # The pragma releases one page per step and the DB-API cursor only steps
+    # once, so run it through executescript(), which steps to completion.
+    connection.ensure_connection()
+    released = 0
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA freelist_count')
+            free = cursor.fetchone()[0]
+        if not free:
+            break
+        step = min(free, pages_per_step)
+        connection.connection.executescript(f'PRAGMA incremental_vacuum({step})')
+        released += step
+        time.sleep(pause)
+    return released
@@ -0,0 +1,170 @@
+"""
+Incremental maintenance of the SessionSummary rollup.
+
+The record_* functions must be called inside the same transaction as the
+PricePrediction write they describe, so the rollup can never be observed
+out of step with the predictions table. Count, sum and last activity are
+updated with F() expressions; min/max only fall back to a per-session
+aggregate when the removed price was the current extreme.
+
+A session's rollup lives on the same shard as its predictions; `using`
+defaults to the shard of the session token.
+"""
+
+import math
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .models import PricePrediction, SessionSummary
+from .sharding import configured_shard_aliases, shard_for
+
+
+def _session_aggregates(queryset):
+    """Aggregate predictions per session into SessionSummary field values."""
+    return (
+        queryset.order_by()
+        .values('session_token')
+        .annotate(
+            prediction_count=Count('id'),
+            price_sum=Sum('predicted_price'),
+            price_min=Min('predicted_price'),
+            price_max=Max('predicted_price'),
+            last_activity=Max('updated_at'),
+        )
+    )
+
+
+def _refresh_extremes(session_token, using):
+    """Recompute price_min/price_max for one session from the predictions table."""
+    extremes = PricePrediction.objects.using(using).filter(session_token=session_token).aggregate(
+        price_min=Min('predicted_price'),
+        price_max=Max('predicted_price'),
+    )
+    SessionSummary.objects.using(using).filter(pk=session_token).update(**extremes)
+
+
+def record_created(prediction, using=None):
+    """Add a newly created prediction to its session's rollup."""
+    using = using or shard_for(prediction.session_token)
+    price = prediction.predicted_price
+    changes = dict(
+        prediction_count=F('prediction_count') + 1,
+        price_sum=F('price_sum') + price,
+        price_min=Least(F('price_min'), Value(price)),
+        price_max=Greatest(F('price_max'), Value(price)),
+        last_activity=prediction.created_at,
+    )
+    summaries = SessionSummary.objects.using(using).filter(pk=prediction.session_token)
+    if summaries.update(**changes):
+        return
+    try:
+        with transaction.atomic(using=using):
+            SessionSummary.objects.using(using).create(
+                session_token=prediction.session_token,
+                prediction_count=1,
+                price_sum=price,
+                price_min=price,
+                price_max=price,
+                last_activity=prediction.created_at,
+            )
+    except IntegrityError:
+        # Another request created the row first
+        summaries.update(**changes)
+
+
+def record_updated(prediction, old_price, using=None):
+    """Apply a change of a prediction's price from `old_price` to its session's rollup."""
+    using = using or shard_for(prediction.session_token)
+    price = prediction.predicted_price
+    summaries = SessionSummary.objects.using(using).filter(pk=prediction.session_token)
+    summaries.update(
+        price_sum=F('price_sum') + (price - old_price),
+        price_min=Least(F('price_min'), Value(price)),
+        price_max=Greatest(F('price_max'), Value(price)),
+        last_activity=prediction.updated_at,
+    )
+    if price != old_price and summaries.filter(Q(price_min=old_price) | Q(price_max=old_price)).exists():
+        _refresh_extremes(prediction.session_token, using)
+
+
+def record_deleted(prediction, using=None):
+    """Remove a deleted prediction from its session's rollup."""
+    using = using or shard_for(prediction.session_token)
+    summaries = SessionSummary.objects.using(using).filter(pk=prediction.session_token)
+    summaries.update(
+        prediction_count=F('prediction_count') - 1,
+        price_sum=F('price_sum') - prediction.predicted_price,
+        last_activity=timezone.now(),
+    )
+    summary = summaries.first()
+    if summary is None:
+        return
+    if summary.prediction_count <= 0:
+        summary.delete()
+    elif prediction.predicted_price in (summary.price_min, summary.price_max):
+        _refresh_extremes(prediction.session_token, using)
+
+
+def refresh_session_summary(session_token, using=None):
+    """Recompute one session's rollup from the predictions table, removing it if empty."""
+    using = using or shard_for(session_token)
+    predictions = PricePrediction.objects.using(using).filter(session_token=session_token)
+    rows = list(_session_aggregates(predictions))
+    if not rows:
+        SessionSummary.objects.using(using).filter(pk=session_token).delete()
+    else:
+        row = rows[0]
+        row.pop('session_token')
+        SessionSummary.objects.using(using).update_or_create(session_token=session_token, defaults=row)
+
+
+def rebuild_session_summaries():
+    """
+    Replace every SessionSummary with values aggregated from the predictions table.
+
+    Each shard is rebuilt from its own rows. Returns the number of sessions written.
+    """
+    written = 0
+    for alias in configured_shard_aliases():
+        with transaction.atomic(using=alias):
+            SessionSummary.objects.using(alias).all().delete()
+            summaries = [
+                SessionSummary(**row)
+                for row in _session_aggregates(PricePrediction.objects.using(alias).all())
+            ]
+            SessionSummary.objects.using(alias).bulk_create(summaries, batch_size=500)
+        written += len(summaries)
+    return written
+
+
+def find_summary_drift():
+    """
+    Compare the rollup with the predictions table on every shard.
+
+    Returns a list of (session_token, field, stored, expected) tuples for
+    every value that disagrees; prices are compared with a relative
+    tolerance to allow for floating point accumulation in price_sum.
+    Last activity is not compared because deletes advance it without
+    leaving a trace in the predictions table.
+    """
+    drift = []
+    for alias in configured_shard_aliases():
+        stored = {
+            summary.session_token: summary
+            for summary in SessionSummary.objects.using(alias).all().iterator()
+        }
+        for row in _session_aggregates(PricePrediction.objects.using(alias).all()).iterator():
+            summary = stored.pop(row['session_token'], None)
+            if summary is None:
+                drift.append((row['session_token'], 'missing', None, row['prediction_count']))
+                continue
+            for field in ('prediction_count', 'price_sum', 'price_min', 'price_max'):
+                actual = getattr(summary, field)
+                if actual is None or not math.isclose(actual, row[field], rel_tol=1e-9, abs_tol=1e-6):
+                    drift.append((row['session_token'], field, actual, row[field]))
+        for session_token, summary in stored.items():
+            drift.append((session_token, 'orphaned', summary.prediction_count, None))
+    return drift
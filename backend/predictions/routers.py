@@ -0,0 +1,58 @@
+"""
+Database routers for sharded and replicated session data.
+
+Session-scoped code routes explicitly with `.using(shard_for(token))`; this
+router covers the remaining cases: a new model instance is saved to the
+shard of its session token (an instance loaded from a database stays on
+it), and only the predictions app is migrated on shards other than
+'default'. Replicas are never migrated or written to.
+"""
+
+from .replicas import is_replica_alias, primary_alias
+from .sharding import is_shard_alias, shard_for
+
+SHARDED_MODELS = frozenset({'priceprediction', 'sessionsummary'})
+
+
+def _is_sharded(model):
+    return model._meta.app_label == 'predictions' and model._meta.model_name in SHARDED_MODELS
+
+
+class ReplicaRouter:
+    """Send writes of instances read from a replica to its primary and keep replicas unmigrated."""
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db and is_replica_alias(instance._state.db):
+            return primary_alias(instance._state.db)
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if is_replica_alias(db):
+            return False
+        return None
+
+
+class ShardRouter:
+    """Route sharded models by session token and keep other apps on 'default'."""
+
+    def _db_for_instance(self, model, **hints):
+        instance = hints.get('instance')
+        if not _is_sharded(model) or instance is None:
+            return None
+        if instance._state.db:
+            return instance._state.db
+        if instance.session_token:
+            return shard_for(instance.session_token)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for_instance(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for_instance(model, **hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == 'default' or not is_shard_alias(db):
+            return None
+        return app_label == 'predictions'
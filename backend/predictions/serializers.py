@@ -6,7 +6,7 @@ and deserializing home price prediction data.
 """
 
 from rest_framework import serializers
-from .models import PricePrediction
+from .models import PricePrediction, PricingJob
 
 
 class PricePredictionSerializer(serializers.ModelSerializer):
@@ -16,8 +16,25 @@ class PricePredictionSerializer(serializers.ModelSerializer):
     Converts PricePrediction model instances to JSON and vice versa.
     Handles validation and serialization of prediction data including
     square footage, bedrooms, predicted price, name, session token, and timestamps.
+    Pass `fields` to serialize only a subset of them.
     """
     class Meta:
         model = PricePrediction
         fields = ['id', 'session_token', 'name', 'square_footage', 'bedrooms', 'predicted_price', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class PricingJobSerializer(serializers.ModelSerializer):
+    """Serializer for the status of a bulk CSV pricing job."""
+    progress = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = PricingJob
+        fields = ['id', 'status', 'progress', 'rows_processed', 'rows_failed', 'error', 'created_at', 'finished_at']
+        read_only_fields = fields
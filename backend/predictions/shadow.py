@@ -0,0 +1,191 @@
+"""
+Shadow scoring of candidate models against live traffic.
+
+When PREDICTIONS_SHADOW_MODELS names one or more candidate models, every
+prediction answered by the live model is also handed to a ShadowScorer.
+The request thread only does a non-blocking put on a bounded queue; if
+the queue is full the inputs are dropped and counted instead of waiting.
+
+A small pool of background threads takes inputs off the queue in
+micro-batches of up to PREDICTIONS_SHADOW_BATCH_SIZE (waiting at most
+PREDICTIONS_SHADOW_BATCH_WAIT seconds to fill one), scores each batch with
+one predict() call per candidate and appends one JSON line per batch to
+PREDICTIONS_SHADOW_LOG:
+
+    {"ts": ..., "pid": ..., "inputs": [[sqft, bedrooms], ...],
+     "primary": [...], "candidates": {"<name>": [...]}, "dropped": 0}
+
+`dropped` is the number of inputs this process dropped since its previous
+record. `manage.py shadow_report` summarizes the log per candidate.
+
+Candidates are configured as {name: dotted path} where the path names a
+callable returning a fitted model with a scikit-learn style predict().
+They are loaded by the first batch, never on the request path.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class ShadowScorer:
+    """Bounded queue and worker threads that score inputs with candidate models."""
+
+    def __init__(self, candidates, log_path, workers=1, queue_size=1000, batch_size=64, batch_wait=0.05):
+        self.candidates = dict(candidates)
+        self.log_path = log_path
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.submitted = 0
+        self.scored = 0
+        self.dropped = 0
+        self._unreported_drops = 0
+        self._models = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pid = None
+
+    def _start(self):
+        """Create the queue and worker threads for this process (again after a fork)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f'shadow-scorer-{i}', daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, square_footage, bedrooms, primary_price):
+        """Queue one scored input for shadow scoring; return False if it was dropped."""
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait((square_footage, bedrooms, primary_price))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                self._unreported_drops += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def stats(self):
+        """Return counters for this process."""
+        with self._lock:
+            return {
+                'submitted': self.submitted,
+                'scored': self.scored,
+                'dropped': self.dropped,
+                'queued': self._queue.qsize() if self._pid == os.getpid() else 0,
+            }
+
+    def flush(self):
+        """Block until every queued input has been scored and logged."""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def _load_models(self):
+        if self._models is None:
+            models = {}
+            for name, factory in self.candidates.items():
+                try:
+                    if isinstance(factory, str):
+                        factory = import_string(factory)
+                    models[name] = factory() if callable(factory) else factory
+                except Exception:
+                    logger.exception('Could not load shadow model %s', name)
+            self._models = models
+        return self._models
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._score(batch)
+            except Exception:
+                logger.exception('Shadow scoring failed for a batch of %d inputs', len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _score(self, batch):
+        import numpy as np
+
+        features = np.array([item[:2] for item in batch], dtype=float)
+        candidates = {}
+        for name, model in self._load_models().items():
+            try:
+                prices = np.maximum(np.asarray(model.predict(features), dtype=float), 0)
+            except Exception:
+                logger.exception('Shadow model %s failed', name)
+                continue
+            candidates[name] = np.round(prices, 2).tolist()
+
+        with self._lock:
+            self.scored += len(batch)
+            dropped, self._unreported_drops = self._unreported_drops, 0
+        if dropped:
+            logger.warning('Shadow scoring dropped %d inputs because the queue was full', dropped)
+        record = {
+            'ts': round(time.time(), 3),
+            'pid': os.getpid(),
+            'inputs': features.tolist(),
+            'primary': [round(item[2], 2) for item in batch],
+            'candidates': candidates,
+            'dropped': dropped,
+        }
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._write_lock, open(self.log_path, 'a') as f:
+            f.write(line)
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+
+def get_shadow_scorer():
+    """Return the process-wide ShadowScorer, or None when no candidate models are configured."""
+    global _scorer
+    if _scorer is None and settings.PREDICTIONS_SHADOW_MODELS:
+        with _scorer_lock:
+            if _scorer is None:
+                _scorer = ShadowScorer(
+                    settings.PREDICTIONS_SHADOW_MODELS,
+                    settings.PREDICTIONS_SHADOW_LOG,
+                    workers=settings.PREDICTIONS_SHADOW_WORKERS,
+                    queue_size=settings.PREDICTIONS_SHADOW_QUEUE_SIZE,
+                    batch_size=settings.PREDICTIONS_SHADOW_BATCH_SIZE,
+                    batch_wait=settings.PREDICTIONS_SHADOW_BATCH_WAIT,
+                )
+    return _scorer
+
+
+def submit_shadow(square_footage, bedrooms, primary_price):
+    """Hand a live prediction to the shadow scorer, if shadow mode is on."""
+    scorer = get_shadow_scorer()
+    if scorer is not None:
+        scorer.submit(square_footage, bedrooms, primary_price)
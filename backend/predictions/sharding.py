@@ -0,0 +1,96 @@
+"""
+Hash sharding of session data across SQLite databases.
+
+PricePrediction and SessionSummary rows are spread over
+PREDICTIONS_SHARD_COUNT databases by a stable hash of the session token, so
+each session lives entirely on one shard and concurrent writes from
+different sessions do not contend for the same SQLite writer lock.
+
+Shard 0 is always the 'default' database and shard i > 0 is the 'shard_<i>'
+alias, so a single-shard deployment is exactly the unsharded layout.
+
+Prediction ids are allocated per shard, so each shard reserves its own id
+range: `migrate` starts shard i's ids above i * SHARD_ID_RANGE (see
+reserve_id_range), which keeps ids unique across shards for up to 2**40
+predictions per shard and below 2**53 for the frontend. Rows created
+before their shard reserved its range may share an id with a row on
+another shard, so predictions are always looked up by id together with the
+session token on the session's shard, never by id alone.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.db import connections
+
+SHARD_ALIAS_PREFIX = 'shard_'
+SHARD_ID_RANGE = 2 ** 40
+
+
+def shard_index(session_token, count):
+    """Return the shard number in [0, count) for a session token."""
+    digest = hashlib.blake2b(session_token.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count
+
+
+def shard_alias(index):
+    """Return the database alias of shard number `index`."""
+    return 'default' if index == 0 else f'{SHARD_ALIAS_PREFIX}{index}'
+
+
+def shard_count():
+    return max(1, getattr(settings, 'PREDICTIONS_SHARD_COUNT', 1))
+
+
+def shard_for(session_token):
+    """Return the database alias that holds a session's rows."""
+    return shard_alias(shard_index(session_token, shard_count()))
+
+
+def shard_aliases():
+    """Return the aliases of the shards that new writes are routed to."""
+    return [shard_alias(i) for i in range(shard_count())]
+
+
+def is_shard_alias(alias):
+    return alias == 'default' or alias.startswith(SHARD_ALIAS_PREFIX)
+
+
+def shard_number(alias):
+    """Return the shard number of a shard alias."""
+    return 0 if alias == 'default' else int(alias[len(SHARD_ALIAS_PREFIX):])
+
+
+def configured_shard_aliases():
+    """
+    Return every shard alias present in DATABASES.
+
+    This can include retired shards beyond PREDICTIONS_SHARD_COUNT that still
+    hold rows waiting to be moved by `rebalance_shards`.
+    """
+    aliases = [alias for alias in connections.databases if is_shard_alias(alias)]
+    return sorted(aliases, key=shard_number)
+
+
+def reserve_id_range(using, **kwargs):
+    """
+    Make a shard allocate prediction ids from its own range.
+
+    Raises the shard's SQLite AUTOINCREMENT sequence for the predictions
+    table to shard_number * SHARD_ID_RANGE unless it is already past it.
+    Connected to post_migrate, so `migrate_shards` (and a test database
+    flush) applies it.
+    """
+    if not is_shard_alias(using) or connections[using].vendor != 'sqlite':
+        return
+    from .models import PricePrediction
+
+    floor = shard_number(using) * SHARD_ID_RANGE
+    table = PricePrediction._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, floor])
+        elif row[0] < floor:
+            cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [floor, table])
@@ -0,0 +1,264 @@
+"""
+Columnar snapshots of PricePrediction for analytics scans.
+
+`manage.py snapshot_predictions` copies the numeric columns of every shard
+into flat binary files, one per column, that are opened with numpy.memmap:
+
+    square_footage  float64
+    bedrooms        int32
+    predicted_price float64
+    created_at      float64  (seconds since the epoch)
+    session         int32    (index into sessions.json)
+
+snapshot.json records the committed row count and, per shard, the last
+prediction id copied. Each run appends only rows with a larger id, so
+snapshots are append-only: later updates and deletes are not reflected
+until the snapshot is rebuilt (also required after `rebalance_shards`,
+which gives moved rows new ids). Column files are written before
+snapshot.json is replaced, and bytes past the committed row count are
+truncated on the next run, so an interrupted run never exposes partial rows.
+
+PredictionSnapshot answers filters and aggregates with vectorized NumPy
+operations over the memmaps without touching SQLite.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .models import PricePrediction
+from .replicas import read_alias_for_shard
+from .sharding import configured_shard_aliases
+
+SNAPSHOT_VERSION = 1
+META_FILE = 'snapshot.json'
+SESSIONS_FILE = 'sessions.json'
+COLUMNS = {
+    'square_footage': np.dtype('<f8'),
+    'bedrooms': np.dtype('<i4'),
+    'predicted_price': np.dtype('<f8'),
+    'created_at': np.dtype('<f8'),
+    'session': np.dtype('<i4'),
+}
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def snapshot_directory(directory=None):
+    return Path(directory or settings.PREDICTIONS_SNAPSHOT_DIR)
+
+
+def _column_path(directory, name):
+    return directory / f'{name}.bin'
+
+
+def _read_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def _write_json(path, data):
+    """Atomically replace `path` with `data` encoded as JSON."""
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _empty_meta():
+    return {
+        'version': SNAPSHOT_VERSION,
+        'rows': 0,
+        'last_ids': {},
+        'columns': {name: dtype.str for name, dtype in COLUMNS.items()},
+    }
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def update_snapshot(directory=None, chunk_size=DEFAULT_CHUNK_SIZE, rebuild=False):
+    """
+    Append predictions created since the last run to the snapshot.
+
+    Rows are read from each shard's replica when it is current (see
+    predictions.replicas) in id order, `chunk_size` at a time. With
+    `rebuild` the snapshot is started over. Returns the number of rows
+    appended.
+    """
+    directory = snapshot_directory(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    if rebuild or not (directory / META_FILE).exists():
+        _write_json(directory / SESSIONS_FILE, [])
+        _write_json(directory / META_FILE, _empty_meta())
+    meta = _read_json(directory / META_FILE, None)
+    if meta['version'] != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {meta['version']}; rebuild the snapshot")
+    sessions = _read_json(directory / SESSIONS_FILE, [])
+    session_codes = {token: code for code, token in enumerate(sessions)}
+
+    def encode(session_token):
+        code = session_codes.get(session_token)
+        if code is None:
+            code = session_codes[session_token] = len(sessions)
+            sessions.append(session_token)
+        return code
+
+    # Drop anything written after the last committed row
+    for name, dtype in COLUMNS.items():
+        with open(_column_path(directory, name), 'ab') as f:
+            f.truncate(meta['rows'] * dtype.itemsize)
+
+    appended = 0
+    for alias in configured_shard_aliases():
+        rows = (
+            PricePrediction.objects.using(read_alias_for_shard(alias))
+            .filter(id__gt=meta['last_ids'].get(alias, 0))
+            .order_by('id')
+            .values_list('id', 'session_token', 'square_footage', 'bedrooms', 'predicted_price', 'created_at')
+            .iterator(chunk_size=chunk_size)
+        )
+        for chunk in _chunks(rows, chunk_size):
+            ids, tokens, square_footage, bedrooms, prices, created = zip(*chunk)
+            known_sessions = len(sessions)
+            codes = [encode(token) for token in tokens]
+            columns = {
+                'square_footage': square_footage,
+                'bedrooms': bedrooms,
+                'predicted_price': prices,
+                'created_at': [value.timestamp() for value in created],
+                'session': codes,
+            }
+            for name, dtype in COLUMNS.items():
+                with open(_column_path(directory, name), 'ab') as f:
+                    f.write(np.asarray(columns[name], dtype=dtype).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            if len(sessions) > known_sessions:
+                _write_json(directory / SESSIONS_FILE, sessions)
+            meta['rows'] += len(chunk)
+            meta['last_ids'][alias] = ids[-1]
+            _write_json(directory / META_FILE, meta)
+            appended += len(chunk)
+    return appended
+
+
+def _as_range(value):
+    """Normalize a filter value to an inclusive (low, high) pair; None means unbounded."""
+    if isinstance(value, (tuple, list)):
+        return value
+    return value, value
+
+
+class PredictionSnapshot:
+    """
+    Read-only view of a snapshot as memory-mapped NumPy arrays.
+
+    Columns are available as attributes (`snapshot.predicted_price`) and
+    only the pages a scan touches are read from disk.
+    """
+
+    def __init__(self, directory=None):
+        directory = snapshot_directory(directory)
+        meta = _read_json(directory / META_FILE, None)
+        if meta is None:
+            raise FileNotFoundError(f'No snapshot in {directory}; run `manage.py snapshot_predictions`')
+        self.rows = meta['rows']
+        self.sessions = _read_json(directory / SESSIONS_FILE, [])
+        self._session_codes = None
+        for name, dtype in COLUMNS.items():
+            if self.rows:
+                column = np.memmap(_column_path(directory, name), dtype=dtype, mode='r', shape=(self.rows,))
+            else:
+                column = np.empty(0, dtype=dtype)
+            setattr(self, name, column)
+
+    def __len__(self):
+        return self.rows
+
+    def session_code(self, session_token):
+        """Return the dictionary code of a session token, or -1 if it is not in the snapshot."""
+        if self._session_codes is None:
+            self._session_codes = {token: code for code, token in enumerate(self.sessions)}
+        return self._session_codes.get(session_token, -1)
+
+    def where(self, session_token=None, since=None, until=None, **ranges):
+        """
+        Return a boolean mask of the rows matching every condition.
+
+        `since`/`until` are datetimes bounding created_at (inclusive).
+        Other keyword arguments name a column and give either a value or an
+        inclusive (low, high) pair where either bound may be None, e.g.
+        `where(bedrooms=3, square_footage=(1500, None))`.
+        """
+        mask = np.ones(self.rows, dtype=bool)
+        if session_token is not None:
+            mask &= self.session == self.session_code(session_token)
+        if since is not None or until is not None:
+            ranges['created_at'] = (
+                since.timestamp() if since is not None else None,
+                until.timestamp() if until is not None else None,
+            )
+        for name, value in ranges.items():
+            if name not in COLUMNS or name == 'session':
+                raise ValueError(f'Unknown snapshot column: {name}')
+            low, high = _as_range(value)
+            column = getattr(self, name)
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        return mask
+
+    def summarize(self, mask=None):
+        """Return count/min/max/mean/median predicted price of the rows in `mask` (default: all)."""
+        prices = self.predicted_price if mask is None else self.predicted_price[mask]
+        if not len(prices):
+            return {'count': 0, 'min_price': None, 'max_price': None, 'mean_price': None, 'median_price': None}
+        return {
+            'count': int(len(prices)),
+            'min_price': float(prices.min()),
+            'max_price': float(prices.max()),
+            'mean_price': float(prices.mean()),
+            'median_price': float(np.median(prices)),
+        }
+
+    def group_by(self, column, mask=None):
+        """
+        Return {value: {'count', 'mean_price'}} of the rows in `mask` grouped by `column`.
+
+        Grouping by 'session' reports session tokens as keys.
+        """
+        if column not in COLUMNS:
+            raise ValueError(f'Unknown snapshot column: {column}')
+        keys = getattr(self, column)
+        prices = self.predicted_price
+        if mask is not None:
+            keys, prices = keys[mask], prices[mask]
+        values, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(values))
+        sums = np.bincount(inverse, weights=prices, minlength=len(values))
+        if column == 'session':
+            values = [self.sessions[code] for code in values]
+        else:
+            values = values.tolist()
+        return {
+            value: {'count': int(count), 'mean_price': float(total / count)}
+            for value, count, total in zip(values, counts, sums)
+        }
@@ -0,0 +1,155 @@
+"""
+Aggregate statistics over home price predictions.
+
+All statistics are computed by the database with aggregate()/annotate() so
+that the cost of a summary does not depend on moving rows into Python:
+count/min/max/mean in one query, the median with at most two single-row
+LIMIT/OFFSET lookups, and the histogram with one GROUP BY query.
+
+When no time window is requested, count/min/max/mean are read from the
+SessionSummary rollup instead: a primary-key lookup for one session, or an
+aggregate over one row per session for all of them.
+
+Summaries take one queryset per shard. A session always lives on a single
+shard; for all-session summaries the per-shard aggregates and histogram
+counts are combined, and the median is found by merging the shards' sorted
+price streams up to the middle row.
+"""
+
+import heapq
+from itertools import islice
+
+from django.db.models import Count, F, IntegerField, Max, Min, Sum, Value
+from django.db.models.functions import Cast, Least
+
+from .models import SessionSummary
+from .sharding import configured_shard_aliases, shard_for
+
+DEFAULT_BUCKETS = 10
+MAX_BUCKETS = 100
+
+
+def price_median(querysets, count):
+    """Return the median predicted price over `querysets`, which hold `count` rows together."""
+    if not count:
+        return None
+    middle = count // 2
+    sorted_prices = [
+        queryset.order_by('predicted_price').values_list('predicted_price', flat=True)
+        for queryset in querysets
+    ]
+    if len(sorted_prices) == 1:
+        prices = sorted_prices[0]
+        if count % 2:
+            return prices[middle]
+        lower, upper = prices[middle - 1:middle + 1]
+        return (lower + upper) / 2
+
+    merged = heapq.merge(*(prices.iterator(chunk_size=2000) for prices in sorted_prices))
+    if count % 2:
+        return next(islice(merged, middle, None))
+    lower, upper = islice(merged, middle - 1, middle + 1)
+    return (lower + upper) / 2
+
+
+def price_histogram(querysets, minimum, maximum, buckets):
+    """
+    Return `buckets` equal-width price ranges between minimum and maximum with row counts.
+
+    The maximum price falls into the last bucket; every bucket is listed,
+    including empty ones.
+    """
+    if minimum is None:
+        return []
+    width = (maximum - minimum) / buckets
+    if width:
+        index = Cast((F('predicted_price') - Value(minimum)) / Value(width), IntegerField())
+        index = Least(index, Value(buckets - 1))
+    else:
+        index = Value(0, output_field=IntegerField())
+
+    counts = [0] * buckets
+    for queryset in querysets:
+        rows = queryset.order_by().annotate(bucket=index).values_list('bucket').annotate(count=Count('id'))
+        for bucket, count in rows:
+            counts[bucket] += count
+    return [
+        {
+            'lower': minimum + i * width,
+            'upper': maximum if i == buckets - 1 else minimum + (i + 1) * width,
+            'count': counts[i],
+        }
+        for i in range(buckets)
+    ]
+
+
+def _combine(totals):
+    """Combine per-shard count/sum/min/max aggregates into summary statistics."""
+    totals = [row for row in totals if row['count']]
+    count = sum(row['count'] for row in totals)
+    if not count:
+        return {'count': 0, 'min_price': None, 'max_price': None, 'mean_price': None}
+    return {
+        'count': count,
+        'min_price': min(row['min_price'] for row in totals),
+        'max_price': max(row['max_price'] for row in totals),
+        'mean_price': sum(row['price_sum'] for row in totals) / count,
+    }
+
+
+def rollup_stats(session_token=None, using=None, aliases=None):
+    """
+    Return count/min/max/mean from the SessionSummary rollup.
+
+    For a single session this is one primary-key lookup on its shard (or on
+    `using`); without a session token the per-session rows of every shard
+    (or of `aliases`) are combined.
+    """
+    if session_token:
+        using = using or shard_for(session_token)
+        summary = SessionSummary.objects.using(using).filter(pk=session_token).first()
+        if summary is None:
+            return _combine([])
+        return {
+            'count': summary.prediction_count,
+            'min_price': summary.price_min,
+            'max_price': summary.price_max,
+            'mean_price': summary.price_mean,
+        }
+
+    return _combine(
+        SessionSummary.objects.using(alias).aggregate(
+            count=Sum('prediction_count'),
+            price_sum=Sum('price_sum'),
+            min_price=Min('price_min'),
+            max_price=Max('price_max'),
+        )
+        for alias in (aliases or configured_shard_aliases())
+    )
+
+
+def summarize_predictions(querysets, buckets=DEFAULT_BUCKETS, stats=None, detail=True):
+    """
+    Summarize the predicted prices in `querysets` (one per shard).
+
+    Returns a dict with count, min/max/mean price and, when `detail` is
+    true, the median and a histogram of `buckets` equal-width buckets.
+    Pass precomputed `stats` (see rollup_stats) to skip the aggregate queries.
+    """
+    if stats is None:
+        stats = _combine(
+            queryset.order_by().aggregate(
+                count=Count('id'),
+                price_sum=Sum('predicted_price'),
+                min_price=Min('predicted_price'),
+                max_price=Max('predicted_price'),
+            )
+            for queryset in querysets
+        )
+    if not detail:
+        return stats
+    return {
+        **stats,
+        'median_price': price_median(querysets, stats['count']),
+        'histogram': price_histogram(querysets, stats['min_price'], stats['max_price'], buckets),
+    }
@@ -5,14 +5,64 @@ This module contains comprehensive test suites for:
 - PricePrediction model and its methods
 - predict_home_price machine learning function
 - REST API endpoints for CRUD operations with session-based access
+- Startup time and memory budget for management commands
+- Gunicorn production server configuration
+- Token-bucket rate limiting and load shedding
+- Aggregate summary endpoint
+- SessionSummary rollup maintenance
+- Retention purge of abandoned sessions
+- Hash sharding of session data, across several shard databases
+- Read replicas and read-your-writes pinning
+- Columnar analytics snapshots
+- Shadow scoring of candidate models
+- Bulk CSV pricing jobs
+- Field projection, compression and compact response formats
 """
 
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import runpy
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import TestCase, SimpleTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import PricePrediction
-from .predictor import predict_home_price
+from .models import PricePrediction, PricingJob, SessionSummary
+from .predictor import predict_home_price, load_model, is_model_loaded
+from . import jobs
+from .management.commands import rebalance_shards
+from .middleware import CompressionMiddleware, LoadSheddingMiddleware, brotli
+from .renderers import msgpack
+from .replicas import pin_to_primary, read_alias, refresh_replica
+from .retention import purge_expired_sessions, retention_cutoff
+from .rollups import find_summary_drift, rebuild_session_summaries, record_updated, refresh_session_summary
+from .routers import ReplicaRouter, ShardRouter
+from .shadow import ShadowScorer
+from .sharding import SHARD_ID_RANGE, reserve_id_range, shard_alias, shard_for, shard_index
+from .snapshots import COLUMNS, PredictionSnapshot, update_snapshot
+from .throttling import BucketStore, SessionRateThrottle, TokenBucket, get_bucket_store
 
 
 class PredictorTests(TestCase):
@@ -220,6 +270,15 @@ class SessionPredictionAPITests(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    def test_detail_write_endpoints_disabled(self):
+        """Test that tokenless update and delete through the generic detail route are rejected"""
+        url = reverse('prediction-detail', args=[self.prediction1.id])
+        for method in ('put', 'patch', 'delete'):
+            response = getattr(self.client, method)(url, {'name': 'Changed'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.prediction1.refresh_from_db()
+        self.assertNotEqual(self.prediction1.name, 'Changed')
+
     def test_session_predictions_with_valid_token(self):
         """Test fetching predictions for a specific session"""
         session_url = reverse('session-data')
@@ -329,3 +388,1323 @@ class SessionPredictionAPITests(TestCase):
         self.assertTrue(
             PricePrediction.objects.filter(id=self.prediction1.id).exists()
         )
+
+
+# Runs `manage.py check` in-process and reports whether the heavy ML
+# dependencies were imported and the peak resident memory in MiB. VmHWM is
+# preferred over ru_maxrss because the latter survives exec() and would
+# report the test runner's own peak.
+_STARTUP_PROBE = """
+import json, resource, sys
+sys.argv = ['manage.py', 'check']
+import runpy
+try:
+    runpy.run_path('manage.py', run_name='__main__')
+except SystemExit:
+    pass
+
+def peak_rss_mib():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+print(json.dumps({
+    'numpy': 'numpy' in sys.modules,
+    'sklearn': 'sklearn' in sys.modules,
+    'maxrss_mib': peak_rss_mib(),
+}))
+"""
+
+
+class StartupBudgetTests(SimpleTestCase):
+    """Tests that management commands start without loading the ML model"""
+
+    def run_check(self):
+        """Run the startup probe in a fresh interpreter and return (seconds, report)"""
+        env = dict(os.environ, PREDICTIONS_WARM_MODEL='False')
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-c', _STARTUP_PROBE],
+            cwd=Path(settings.BASE_DIR),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        elapsed = time.perf_counter() - started
+        return elapsed, json.loads(result.stdout.strip().splitlines()[-1])
+
+    def test_check_does_not_import_ml_dependencies(self):
+        """Test that manage.py check never imports numpy or sklearn"""
+        _, report = self.run_check()
+        self.assertFalse(report['numpy'])
+        self.assertFalse(report['sklearn'])
+
+    def test_check_within_startup_budget(self):
+        """Test that manage.py check stays within the time and memory budget"""
+        elapsed, report = self.run_check()
+        self.assertLess(elapsed, settings.PREDICTIONS_STARTUP_TIME_BUDGET)
+        self.assertLess(report['maxrss_mib'], settings.PREDICTIONS_STARTUP_MEMORY_BUDGET)
+
+    def test_load_model_is_idempotent(self):
+        """Test that warming the model returns the same fitted instance"""
+        model = load_model()
+        self.assertTrue(is_model_loaded())
+        self.assertIs(load_model(), model)
+
+
+class GunicornConfigTests(SimpleTestCase):
+    """Tests for the production server configuration"""
+
+    def load_config(self, **env):
+        """Evaluate config/gunicorn.conf.py and return its settings and resulting environment"""
+        with mock.patch.dict(os.environ):
+            # Values the config only sets by default, e.g. from a developer's .env
+            for name in ('PREDICTIONS_WARM_MODEL', 'PREDICTIONS_THROTTLE_WORKERS'):
+                os.environ.pop(name, None)
+            os.environ.update(env)
+            config = runpy.run_path(str(Path(settings.BASE_DIR) / 'config' / 'gunicorn.conf.py'))
+            return config, dict(os.environ)
+
+    def test_preloads_application(self):
+        """Test that the app and model are loaded in the master before forking"""
+        config, environ = self.load_config()
+        self.assertTrue(config['preload_app'])
+        self.assertEqual(environ.get('PREDICTIONS_WARM_MODEL'), 'True')
+
+    def test_environment_overrides(self):
+        """Test that workers, threads and timeouts come from the environment"""
+        config, environ = self.load_config(GUNICORN_WORKERS='3', GUNICORN_THREADS='4', GUNICORN_TIMEOUT='60')
+        self.assertEqual(config['workers'], 3)
+        self.assertEqual(environ['PREDICTIONS_THROTTLE_WORKERS'], '3')
+        self.assertEqual(config['threads'], 4)
+        self.assertEqual(config['timeout'], 60)
+        self.assertEqual(config['worker_class'], 'gthread')
+
+    def test_loadtest_reports_no_speedup_for_failing_rounds(self):
+        """Test that a round dominated by errors gets no speedup and the server runs unthrottled"""
+        rounds = [
+            {'requests': 100, 'errors': 0, 'rps': 10.0, 'p50': 1.0, 'p95': 2.0},
+            {'requests': 88, 'errors': 1180, 'rps': 20.0, 'p50': 1.0, 'p95': 2.0},
+        ]
+        out, err = StringIO(), StringIO()
+        with mock.patch('predictions.management.commands.loadtest.subprocess.run') as run, \
+                mock.patch('predictions.management.commands.loadtest.Command.run_round', side_effect=rounds):
+            call_command('loadtest', '--workers', '1', '2', stdout=out, stderr=err)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[2].endswith('1.00x'))
+        self.assertTrue(lines[3].endswith('-'))
+        self.assertIn('Speedup not reported', err.getvalue())
+        self.assertIn('migrate_shards', run.call_args.args[0])
+        env = run.call_args.kwargs['env']
+        self.assertEqual(env['PREDICTIONS_REPLICAS_ENABLED'], 'False')
+        self.assertEqual(env['PREDICTIONS_MAX_IN_FLIGHT'], '0')
+        self.assertEqual(env['THROTTLE_CREATE_IP_RATE'], '1000000000/s')
+
+
+class RateLimitTests(TestCase):
+    """Tests for the per-session token-bucket throttle"""
+
+    def setUp(self):
+        """Start every test with empty buckets"""
+        self.client = APIClient()
+        self.api_url = reverse('prediction-list')
+        get_bucket_store().clear()
+
+    def tearDown(self):
+        get_bucket_store().clear()
+
+    def test_token_bucket_refills_over_time(self):
+        """Test that a drained bucket allows requests again after refilling"""
+        bucket = TokenBucket(rate=1.0, capacity=2, now=0.0)
+        self.assertEqual(bucket.consume(0.0), 0)
+        self.assertEqual(bucket.consume(0.0), 0)
+        self.assertAlmostEqual(bucket.consume(0.0), 1.0)
+        self.assertEqual(bucket.consume(1.0), 0)
+
+    def test_bucket_store_evicts_least_recently_used(self):
+        """Test that the store never holds more than max_keys buckets"""
+        store = BucketStore(max_keys=2)
+        store.consume('a', 1.0, 1, now=0.0)
+        store.consume('b', 1.0, 1, now=0.0)
+        store.consume('a', 1.0, 1, now=0.0)
+        store.consume('c', 1.0, 1, now=0.0)
+        self.assertEqual(len(store), 2)
+        # 'b' was evicted, so it starts again with a full bucket
+        self.assertEqual(store.consume('b', 1.0, 1, now=0.0), 0)
+        # 'a' was evicted in turn and 'c' is still drained
+        self.assertGreater(store.consume('c', 1.0, 1, now=0.0), 0)
+
+    @override_settings(PREDICTIONS_THROTTLE_RATES={
+        'prediction-list': {'rate': '1/min', 'burst': 2, 'ip_rate': '1/min', 'ip_burst': 3},
+        'default': None,
+    })
+    def test_create_throttled_per_session(self):
+        """Test that a session exceeding its burst gets 429 with Retry-After"""
+        data = {'session_token': 'busy-session', 'square_footage': 2000, 'bedrooms': 3}
+        for _ in range(2):
+            response = self.client.post(self.api_url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.post(self.api_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+        # Another session from the same IP has its own session bucket, but
+        # shares the IP bucket, which has one token left
+        data['session_token'] = 'quiet-session'
+        response = self.client.post(self.api_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(self.api_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(PREDICTIONS_THROTTLE_RATES={
+        'prediction-list': {'rate': '1/min', 'burst': 2, 'ip_rate': '1/min', 'ip_burst': 5},
+        'default': None,
+    })
+    def test_rotating_session_tokens_share_ip_limit(self):
+        """Test that a new session token per request does not bypass the per-IP limit"""
+        codes = [
+            self.client.post(
+                self.api_url, {'session_token': f'rotating-{i}', 'square_footage': 2000, 'bedrooms': 3},
+                format='json',
+            ).status_code
+            for i in range(8)
+        ]
+        self.assertEqual(codes, [status.HTTP_201_CREATED] * 5 + [status.HTTP_429_TOO_MANY_REQUESTS] * 3)
+
+    @override_settings(PREDICTIONS_THROTTLE_RATES={
+        'prediction-list': {'rate': '1/min', 'burst': 2, 'ip_rate': '1/min', 'ip_burst': 5},
+        'default': None,
+    })
+    def test_rotating_forwarded_for_does_not_bypass_ip_limit(self):
+        """Test that X-Forwarded-For is ignored unless a trusted proxy is configured"""
+        def post(i):
+            return self.client.post(
+                self.api_url, {'session_token': f'forwarded-{i}', 'square_footage': 2000, 'bedrooms': 3},
+                format='json', HTTP_X_FORWARDED_FOR=f'203.0.113.{i}',
+            ).status_code
+
+        codes = [post(i) for i in range(8)]
+        self.assertEqual(codes, [status.HTTP_201_CREATED] * 5 + [status.HTTP_429_TOO_MANY_REQUESTS] * 3)
+
+        # Behind one trusted proxy the forwarded address identifies the client
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            self.assertEqual(post(8), status.HTTP_201_CREATED)
+
+    @override_settings(PREDICTIONS_THROTTLE_RATES={
+        'prediction-list': {'rate': '1/min', 'burst': 1},
+        'default': None,
+    })
+    def test_form_and_multipart_clients_have_own_buckets(self):
+        """Test that the session token is read from form-encoded and multipart bodies"""
+        def post_form(session_token):
+            body = urlencode({'session_token': session_token, 'square_footage': 2000, 'bedrooms': 3})
+            return self.client.generic('POST', self.api_url, body, content_type='application/x-www-form-urlencoded')
+
+        def post_multipart(session_token):
+            data = {'session_token': session_token, 'square_footage': 2000, 'bedrooms': 3}
+            return self.client.post(self.api_url, data, format='multipart')
+
+        for post, session_token in ((post_form, 'form-session'), (post_multipart, 'multipart-session')):
+            self.assertEqual(post(session_token).status_code, status.HTTP_201_CREATED)
+            self.assertEqual(post(session_token).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(
+        PREDICTIONS_THROTTLE_RATES={'default': {'rate': '60/min', 'burst': 20, 'ip_rate': '120/min', 'ip_burst': 40}},
+        PREDICTIONS_THROTTLE_WORKERS=4,
+    )
+    def test_rates_are_split_between_workers(self):
+        """Test that each worker process enforces its share of the configured rates"""
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        _, limits = SessionRateThrottle().get_rate(request)
+        self.assertEqual(limits, (0.25, 5, 0.5, 10))
+
+    @override_settings(PREDICTIONS_THROTTLE_RATES={'default': None})
+    def test_unconfigured_endpoint_not_throttled(self):
+        """Test that a rate of None disables throttling"""
+        data = {'session_token': 'free-session', 'square_footage': 2000, 'bedrooms': 3}
+        for _ in range(5):
+            response = self.client.post(self.api_url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class LoadSheddingTests(SimpleTestCase):
+    """Tests for the global load-shedding middleware"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    @override_settings(PREDICTIONS_MAX_IN_FLIGHT=1, PREDICTIONS_MAX_PENDING_WRITES=0)
+    def test_sheds_when_in_flight_limit_reached(self):
+        """Test that a request arriving while the limit is in use gets 503"""
+        nested = {}
+
+        def get_response(request):
+            nested['response'] = middleware(self.factory.get('/api/predictions/session-data/'))
+            return HttpResponse('ok')
+
+        middleware = LoadSheddingMiddleware(get_response)
+        response = middleware(self.factory.get('/api/predictions/session-data/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(nested['response'].status_code, 503)
+        self.assertEqual(nested['response']['Retry-After'], '1')
+        self.assertEqual(middleware.in_flight, 0)
+
+    @override_settings(PREDICTIONS_MAX_IN_FLIGHT=0, PREDICTIONS_MAX_PENDING_WRITES=1)
+    def test_sheds_writes_but_not_reads(self):
+        """Test that the write limit only rejects writes"""
+        nested = {}
+
+        def get_response(request):
+            if request.method == 'POST':
+                nested['write'] = middleware(self.factory.post('/api/predictions/'))
+                nested['read'] = middleware(self.factory.get('/api/predictions/session-data/'))
+            return HttpResponse('ok')
+
+        middleware = LoadSheddingMiddleware(get_response)
+        middleware(self.factory.post('/api/predictions/'))
+        self.assertEqual(nested['write'].status_code, 503)
+        self.assertEqual(nested['read'].status_code, 200)
+        self.assertEqual(middleware.pending_writes, 0)
+
+    def test_shed_responses_have_cors_headers(self):
+        """Test that browsers can read the 503 status and Retry-After of a shed request"""
+        with mock.patch.object(LoadSheddingMiddleware, '__call__', lambda middleware, request: middleware.shed()):
+            response = APIClient().get('/api/predictions/session-data/', HTTP_ORIGIN='http://localhost:5173')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Access-Control-Allow-Origin'], 'http://localhost:5173')
+        self.assertIn('Retry-After', response['Access-Control-Expose-Headers'])
+
+
+class SessionSummaryAPITests(TestCase):
+    """Tests for the aggregate summary endpoint"""
+
+    def setUp(self):
+        """Create predictions in two sessions"""
+        self.client = APIClient()
+        self.url = reverse('session-summary')
+        get_bucket_store().clear()
+        for price in (100000, 200000, 300000, 400000):
+            PricePrediction.objects.create(
+                session_token='summary-session',
+                square_footage=1000,
+                bedrooms=2,
+                predicted_price=price,
+            )
+        PricePrediction.objects.create(
+            session_token='other-session',
+            square_footage=5000,
+            bedrooms=6,
+            predicted_price=900000,
+        )
+        rebuild_session_summaries()
+
+    def test_session_summary_statistics(self):
+        """Test count, min, max, mean and median for one session"""
+        response = self.client.get(f'{self.url}?session_token=summary-session')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(response.data['min_price'], 100000)
+        self.assertEqual(response.data['max_price'], 400000)
+        self.assertEqual(response.data['mean_price'], 250000)
+        self.assertEqual(response.data['median_price'], 250000)
+
+    def test_session_summary_histogram(self):
+        """Test that the histogram has the requested buckets and counts every row"""
+        response = self.client.get(f'{self.url}?session_token=summary-session&buckets=3')
+        histogram = response.data['histogram']
+        self.assertEqual(len(histogram), 3)
+        self.assertEqual([bucket['count'] for bucket in histogram], [1, 1, 2])
+        self.assertEqual(histogram[0]['lower'], 100000)
+        self.assertEqual(histogram[-1]['upper'], 400000)
+
+    def test_summary_runs_in_constant_queries(self):
+        """Test that the summary does not fetch rows one by one"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'{self.url}?session_token=summary-session')
+        self.assertLessEqual(len(queries), 3)
+
+    def test_all_sessions_summary_with_window(self):
+        """Test summarizing all sessions within a time window"""
+        PricePrediction.objects.filter(session_token='other-session').update(
+            created_at=timezone.now() - timedelta(days=30)
+        )
+        since = (timezone.now() - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S')
+        response = self.client.get(f'{self.url}?all=true')
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(response.data['median_price'], 300000)
+        response = self.client.get(f'{self.url}?all=true&since={since}')
+        self.assertEqual(response.data['count'], 4)
+
+    def test_summary_without_detail_is_single_lookup(self):
+        """Test that detail=false answers from the rollup with one query"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'{self.url}?session_token=summary-session&detail=false')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(response.data['mean_price'], 250000)
+        self.assertNotIn('histogram', response.data)
+
+    def test_empty_session_summary(self):
+        """Test the summary of a session without predictions"""
+        response = self.client.get(f'{self.url}?session_token=unknown')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 0)
+        self.assertIsNone(response.data['median_price'])
+        self.assertEqual(response.data['histogram'], [])
+
+    def test_summary_requires_session_or_all(self):
+        """Test that the summary needs a session token unless all=true"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_summary_invalid_parameters(self):
+        """Test validation of buckets and time window parameters"""
+        response = self.client.get(f'{self.url}?session_token=summary-session&buckets=0')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f'{self.url}?all=true&since=yesterday')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SessionSummaryRollupTests(TestCase):
+    """Tests for incremental maintenance of the SessionSummary rollup"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.session = 'rollup-session'
+        get_bucket_store().clear()
+
+    def create(self, square_footage, bedrooms):
+        """Create a prediction through the API and return its response data"""
+        response = self.client.post(reverse('prediction-list'), {
+            'session_token': self.session,
+            'square_footage': square_footage,
+            'bedrooms': bedrooms,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+
+    def assertRollupMatchesTable(self):
+        self.assertEqual(find_summary_drift(), [])
+
+    def test_create_updates_rollup(self):
+        """Test that creating predictions maintains count, sum, min and max"""
+        small = self.create(1000, 2)
+        large = self.create(3000, 5)
+        summary = SessionSummary.objects.get(pk=self.session)
+        self.assertEqual(summary.prediction_count, 2)
+        self.assertAlmostEqual(summary.price_sum, small['predicted_price'] + large['predicted_price'])
+        self.assertEqual(summary.price_min, small['predicted_price'])
+        self.assertEqual(summary.price_max, large['predicted_price'])
+        self.assertRollupMatchesTable()
+
+    def test_update_moves_extremes(self):
+        """Test that updating the cheapest prediction recomputes the minimum"""
+        small = self.create(1000, 2)
+        self.create(2000, 3)
+        self.create(3000, 5)
+        update_url = reverse('session-update', args=[small['id']])
+        response = self.client.patch(
+            f'{update_url}?session_token={self.session}', {'square_footage': 4000}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        summary = SessionSummary.objects.get(pk=self.session)
+        self.assertEqual(summary.price_max, response.data['predicted_price'])
+        self.assertRollupMatchesTable()
+
+    def test_delete_updates_and_removes_rollup(self):
+        """Test that deleting predictions shrinks and finally removes the rollup"""
+        first = self.create(1000, 2)
+        second = self.create(3000, 5)
+        for prediction in (second, first):
+            delete_url = reverse('session-delete', args=[prediction['id']])
+            self.client.delete(f'{delete_url}?session_token={self.session}')
+            self.assertRollupMatchesTable()
+        self.assertFalse(SessionSummary.objects.filter(pk=self.session).exists())
+
+    def test_update_of_concurrently_deleted_row_is_not_found(self):
+        """Test that an update does not recreate a row deleted after its first read"""
+        prediction = self.create(1000, 2)
+
+        def concurrent_delete(square_footage, bedrooms):
+            PricePrediction.objects.filter(pk=prediction['id']).delete()
+            return 250000.0
+
+        update_url = reverse('session-update', args=[prediction['id']])
+        with mock.patch('predictions.views.predict_home_price', side_effect=concurrent_delete):
+            response = self.client.patch(
+                f'{update_url}?session_token={self.session}', {'square_footage': 1500}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(PricePrediction.objects.filter(pk=prediction['id']).exists())
+
+    def test_repeated_delete_counts_once(self):
+        """Test that only the request that removed a row updates the rollup"""
+        first = self.create(1000, 2)
+        self.create(3000, 5)
+        delete_url = f"{reverse('session-delete', args=[first['id']])}?session_token={self.session}"
+        self.assertEqual(self.client.delete(delete_url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.delete(delete_url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(SessionSummary.objects.get(pk=self.session).prediction_count, 1)
+        self.assertRollupMatchesTable()
+
+    def test_rebuild_command_repairs_drift(self):
+        """Test that --check reports drift and a rebuild repairs it"""
+        self.create(1000, 2)
+        SessionSummary.objects.filter(pk=self.session).update(prediction_count=5)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_session_summaries', '--check', stdout=StringIO())
+        call_command('rebuild_session_summaries', stdout=StringIO())
+        call_command('rebuild_session_summaries', '--check', stdout=StringIO())
+        self.assertEqual(SessionSummary.objects.get(pk=self.session).prediction_count, 1)
+
+
+class RetentionPurgeTests(TestCase):
+    """Tests for the purge_expired_sessions command"""
+
+    def setUp(self):
+        """Create one abandoned and one active session"""
+        for i in range(5):
+            PricePrediction.objects.create(
+                session_token='abandoned', square_footage=1000 + i, bedrooms=2, predicted_price=200000,
+            )
+        PricePrediction.objects.create(
+            session_token='active', square_footage=2000, bedrooms=3, predicted_price=300000,
+        )
+        rebuild_session_summaries()
+        SessionSummary.objects.filter(pk='abandoned').update(
+            last_activity=timezone.now() - timedelta(days=120)
+        )
+
+    def test_purge_removes_only_expired_sessions(self):
+        """Test that expired sessions are deleted in batches and active ones kept"""
+        out = StringIO()
+        call_command('purge_expired_sessions', '--days', '90', '--batch-size', '2', '--sleep', '0', stdout=out)
+        self.assertIn('Purged 1 sessions (5 predictions)', out.getvalue())
+        self.assertFalse(PricePrediction.objects.filter(session_token='abandoned').exists())
+        self.assertFalse(SessionSummary.objects.filter(pk='abandoned').exists())
+        self.assertTrue(PricePrediction.objects.filter(session_token='active').exists())
+        self.assertEqual(find_summary_drift(), [])
+
+    def test_purge_respects_retention_period(self):
+        """Test that nothing is deleted when the retention period is longer"""
+        call_command('purge_expired_sessions', '--days', '365', '--sleep', '0', stdout=StringIO())
+        self.assertEqual(PricePrediction.objects.count(), 6)
+
+    def test_dry_run_deletes_nothing(self):
+        """Test that --dry-run only reports"""
+        out = StringIO()
+        call_command('purge_expired_sessions', '--dry-run', stdout=out)
+        self.assertIn('Would purge 1 sessions (5 predictions)', out.getvalue())
+        self.assertEqual(PricePrediction.objects.count(), 6)
+
+
+class ShardingTests(TestCase):
+    """Tests for session-token sharding and the shard router"""
+
+    def test_shard_index_is_stable_and_in_range(self):
+        """Test that a token always maps to the same shard within range"""
+        self.assertEqual(shard_index('session-1', 8), shard_index('session-1', 8))
+        indexes = {shard_index(f'session-{i}', 4) for i in range(200)}
+        self.assertEqual(indexes, {0, 1, 2, 3})
+
+    def test_single_shard_is_default(self):
+        """Test that one shard keeps everything on the default database"""
+        with override_settings(PREDICTIONS_SHARD_COUNT=1):
+            self.assertEqual(shard_for('any-session'), 'default')
+        self.assertEqual(shard_alias(0), 'default')
+        self.assertEqual(shard_alias(3), 'shard_3')
+
+    @override_settings(PREDICTIONS_SHARD_COUNT=4)
+    def test_router_routes_new_instances_by_session(self):
+        """Test that unsaved predictions are written to their session's shard"""
+        router = ShardRouter()
+        prediction = PricePrediction(session_token='routed-session')
+        expected = shard_alias(shard_index('routed-session', 4))
+        self.assertEqual(router.db_for_write(PricePrediction, instance=prediction), expected)
+        prediction._state.db = 'shard_9'
+        self.assertEqual(router.db_for_write(PricePrediction, instance=prediction), 'shard_9')
+
+    def test_router_only_migrates_predictions_on_shards(self):
+        """Test that shards other than default only receive the predictions app"""
+        router = ShardRouter()
+        self.assertTrue(router.allow_migrate('shard_1', 'predictions'))
+        self.assertFalse(router.allow_migrate('shard_1', 'auth'))
+        self.assertIsNone(router.allow_migrate('default', 'auth'))
+
+    def test_refresh_session_summary(self):
+        """Test recomputing and removing a single session's rollup"""
+        PricePrediction.objects.create(
+            session_token='refresh-session', square_footage=1000, bedrooms=2, predicted_price=100000,
+        )
+        refresh_session_summary('refresh-session')
+        self.assertEqual(SessionSummary.objects.get(pk='refresh-session').prediction_count, 1)
+        PricePrediction.objects.filter(session_token='refresh-session').delete()
+        refresh_session_summary('refresh-session')
+        self.assertFalse(SessionSummary.objects.filter(pk='refresh-session').exists())
+
+    def test_benchmark_command_reports_each_shard_count(self):
+        """Test that the shard benchmark runs and reports every shard count"""
+        out = StringIO()
+        call_command('benchmark_shards', '--shards', '1', '2', '--writers', '2', '--seconds', '0.2', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[2:]], ['1', '2'])
+
+
+def _token_on_shard(index, count, prefix='multi'):
+    """Return the first '<prefix>-<n>' session token that hashes to shard `index` of `count`."""
+    n = 0
+    while shard_index(f'{prefix}-{n}', count) != index:
+        n += 1
+    return f'{prefix}-{n}'
+
+
+def _add_scratch_shards(test_class, aliases):
+    """
+    Add SQLite files for `aliases` to the connections until `test_class` has finished.
+
+    Returns {alias: path}. The files are not migrated.
+    """
+    tmpdir = tempfile.TemporaryDirectory()
+    test_class.addClassCleanup(tmpdir.cleanup)
+    paths = {alias: Path(tmpdir.name) / f'{alias}.sqlite3' for alias in aliases}
+    databases = mock.patch.dict(connections.databases, {
+        alias: {**connections.databases['default'], 'NAME': path} for alias, path in paths.items()
+    })
+    databases.start()
+    test_class.addClassCleanup(databases.stop)
+    for alias in aliases:
+        test_class.addClassCleanup(connections.__delitem__, alias)
+        test_class.addClassCleanup(connections[alias].close)
+    return paths
+
+
+@override_settings(PREDICTIONS_SHARD_COUNT=3)
+class MultiShardTests(TestCase):
+    """Tests for the API, migrations and rebalancing with three shard databases"""
+
+    # Resolved in setUpClass, after the shard databases have been added
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        _add_scratch_shards(cls, ['shard_1', 'shard_2'])
+        cls.migrate_output = StringIO()
+        call_command('migrate_shards', verbosity=0, stdout=cls.migrate_output)
+        super().setUpClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.api_url = reverse('prediction-list')
+        get_bucket_store().clear()
+        self.addCleanup(get_bucket_store().clear)
+
+    def create(self, session_token, square_footage=2000, bedrooms=3):
+        response = self.client.post(self.api_url, {
+            'session_token': session_token, 'square_footage': square_footage, 'bedrooms': bedrooms,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+
+    def shard_rows(self, alias, session_token):
+        return PricePrediction.objects.using(alias).filter(session_token=session_token)
+
+    def test_migrate_shards_reserves_id_ranges(self):
+        """Test that every shard is migrated and allocates ids from its own range"""
+        self.assertIn('Migrating shard_1...', self.migrate_output.getvalue())
+        self.assertIn('Migrating shard_2...', self.migrate_output.getvalue())
+        for index in range(3):
+            prediction = self.create(_token_on_shard(index, 3))
+            self.assertGreater(prediction['id'], index * SHARD_ID_RANGE)
+            self.assertLess(prediction['id'], (index + 1) * SHARD_ID_RANGE)
+
+        reserve_id_range('shard_1')
+        self.assertEqual(self.create(_token_on_shard(1, 3))['id'], SHARD_ID_RANGE + 2)
+
+    def test_views_route_each_session_to_its_shard(self):
+        """Test that creates, history, updates and deletes stay on the session's shard"""
+        tokens = [_token_on_shard(index, 3) for index in range(3)]
+        created = {token: [self.create(token, 1000 + i * 500) for i in range(2)] for token in tokens}
+        ids = [prediction['id'] for predictions in created.values() for prediction in predictions]
+        self.assertEqual(len(set(ids)), len(ids))
+        for index, token in enumerate(tokens):
+            self.assertEqual(self.shard_rows(shard_alias(index), token).count(), 2)
+            response = self.client.get(reverse('session-data'), {'session_token': token})
+            self.assertEqual(sorted(row['id'] for row in response.data), [p['id'] for p in created[token]])
+
+        target = created[tokens[2]][0]['id']
+        update_url = reverse('session-update', args=[target])
+        response = self.client.patch(f'{update_url}?session_token={tokens[0]}', {'bedrooms': 5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.patch(f'{update_url}?session_token={tokens[2]}', {'bedrooms': 5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(PricePrediction.objects.using('shard_2').get(pk=target).bedrooms, 5)
+
+        delete_url = reverse('session-delete', args=[created[tokens[1]][0]['id']])
+        response = self.client.delete(f'{delete_url}?session_token={tokens[2]}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.delete(f'{delete_url}?session_token={tokens[1]}')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.shard_rows('shard_1', tokens[1]).count(), 1)
+
+        response = self.client.get(reverse('session-summary'), {'session_token': tokens[1]})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(find_summary_drift(), [])
+
+    def test_summary_merges_all_shards(self):
+        """Test that the all-sessions summary combines the rollups and merges prices from every shard"""
+        for index in range(3):
+            for square_footage in (800 + index * 700, 1200 + index * 900, 5000 - index * 1100):
+                self.create(_token_on_shard(index, 3), square_footage)
+        prices = sorted(
+            price for alias in ('default', 'shard_1', 'shard_2')
+            for price in PricePrediction.objects.using(alias).values_list('predicted_price', flat=True)
+        )
+        self.assertEqual(len(prices), 9)
+
+        for params in ({'all': 'true'}, {'all': 'true', 'since': '2000-01-01T00:00:00'}):
+            response = self.client.get(reverse('session-summary'), {**params, 'buckets': 3})
+            self.assertEqual(response.data['count'], 9)
+            self.assertAlmostEqual(response.data['min_price'], prices[0], places=2)
+            self.assertAlmostEqual(response.data['max_price'], prices[-1], places=2)
+            self.assertAlmostEqual(response.data['mean_price'], statistics.mean(prices), places=2)
+            self.assertAlmostEqual(response.data['median_price'], statistics.median(prices), places=2)
+            self.assertEqual(sum(bucket['count'] for bucket in response.data['histogram']), 9)
+
+    def test_rebalance_three_to_two_shards(self):
+        """Test that shrinking to two shards moves every session once and keeps the rollups exact"""
+        tokens = [f'rebalance-{n}' for n in range(12)]
+        for n, token in enumerate(tokens):
+            for i in range(n % 3 + 1):
+                self.create(token, 1000 + i * 250)
+        counts = {token: n % 3 + 1 for n, token in enumerate(tokens)}
+        self.assertTrue(any(shard_for(token) == 'shard_2' for token in tokens))
+
+        with override_settings(PREDICTIONS_SHARD_COUNT=2):
+            misplaced = [token for token in tokens if shard_for(token) != shard_alias(shard_index(token, 3))]
+            # An earlier run that copied a session's first row and died before deleting it
+            interrupted = misplaced[0]
+            first = self.shard_rows(shard_alias(shard_index(interrupted, 3)), interrupted).order_by('id')[:1]
+            rebalance_shards._insert_rows(list(first), shard_for(interrupted))
+
+            out = StringIO()
+            call_command('rebalance_shards', '--sleep', '0', stdout=out)
+            moved = sum(counts[token] for token in misplaced) - 1
+            self.assertIn(f'Moved {len(misplaced)} sessions ({moved} predictions)', out.getvalue())
+
+            self.assertFalse(PricePrediction.objects.using('shard_2').exists())
+            self.assertFalse(SessionSummary.objects.using('shard_2').exists())
+            for token in tokens:
+                self.assertEqual(self.shard_rows(shard_for(token), token).count(), counts[token])
+                response = self.client.get(reverse('session-summary'), {'session_token': token})
+                self.assertEqual(response.data['count'], counts[token])
+            self.assertEqual(find_summary_drift(), [])
+
+            out = StringIO()
+            call_command('rebalance_shards', '--sleep', '0', stdout=out)
+            self.assertIn('Moved 0 sessions (0 predictions)', out.getvalue())
+
+
+REFRESH_SUMMARY_SQL = (
+    f'INSERT OR REPLACE INTO {SessionSummary._meta.db_table} '
+    '(session_token, prediction_count, price_sum, price_min, price_max, last_activity) '
+    'SELECT session_token, COUNT(*), SUM(predicted_price), MIN(predicted_price), MAX(predicted_price), MAX(updated_at) '
+    f'FROM {PricePrediction._meta.db_table} WHERE session_token = ? GROUP BY session_token'
+)
+
+
+@override_settings(PREDICTIONS_SHARD_COUNT=2)
+class ConcurrentShardWriteTests(SimpleTestCase):
+    """Tests for session updates, deletes and purges racing a second connection's write to the same shard file"""
+
+    # Resolved in setUpClass, after the shard database has been added
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.shard_path = _add_scratch_shards(cls, ['shard_1'])['shard_1']
+        call_command('migrate', database='shard_1', verbosity=0)
+        super().setUpClass()
+
+    def setUp(self):
+        load_model()
+        self.client = APIClient()
+        self.session = _token_on_shard(1, 2, prefix='race')
+        get_bucket_store().clear()
+        self.addCleanup(get_bucket_store().clear)
+        self.addCleanup(SessionSummary.objects.using('shard_1').all().delete)
+        self.addCleanup(PricePrediction.objects.using('shard_1').all().delete)
+        self.prediction = self.create(self.session, 1000, 2)
+        self.create(self.session, 3000, 5)
+        self.other = sqlite3.connect(self.shard_path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.addCleanup(self.other.close)
+
+    def create(self, session_token, square_footage, bedrooms):
+        response = self.client.post(reverse('prediction-list'), {
+            'session_token': session_token, 'square_footage': square_footage, 'bedrooms': bedrooms,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+
+    def commit_later(self, delay=0.5):
+        """Commit the other connection's open write transaction from a thread after `delay` seconds"""
+        timer = threading.Timer(delay, self.other.execute, ['COMMIT'])
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def url(self, name):
+        return f"{reverse(name, args=[self.prediction['id']])}?session_token={self.session}"
+
+    def test_update_waits_for_concurrent_price_change(self):
+        """Test that an update racing another connection's price change succeeds and keeps the rollup exact"""
+        self.other.execute('BEGIN IMMEDIATE')
+        self.other.execute(
+            f'UPDATE {PricePrediction._meta.db_table} SET predicted_price = 123456 WHERE id = ?',
+            [self.prediction['id']],
+        )
+        self.other.execute(REFRESH_SUMMARY_SQL, [self.session])
+        self.commit_later()
+        response = self.client.patch(self.url('session-update'), {'square_footage': 1500}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(find_summary_drift(), [])
+
+    def test_delete_waits_for_concurrent_create(self):
+        """Test that a delete racing another session's create on the same shard succeeds"""
+        other_session = _token_on_shard(1, 2, prefix='race-other')
+        self.other.execute('BEGIN IMMEDIATE')
+        self.other.execute(
+            f'INSERT INTO {PricePrediction._meta.db_table} '
+            '(session_token, name, square_footage, bedrooms, predicted_price, created_at, updated_at) '
+            "VALUES (?, '', 2000, 3, 300000, datetime('now'), datetime('now'))",
+            [other_session],
+        )
+        self.other.execute(REFRESH_SUMMARY_SQL, [other_session])
+        self.commit_later()
+        response = self.client.delete(self.url('session-delete'))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(SessionSummary.objects.using('shard_1').get(pk=self.session).prediction_count, 1)
+        self.assertEqual(find_summary_drift(), [])
+
+    def test_purge_waits_for_concurrent_create(self):
+        """Test that a purge batch racing another session's create on the same shard succeeds"""
+        SessionSummary.objects.using('shard_1').filter(pk=self.session).update(
+            last_activity=timezone.now() - timedelta(days=120)
+        )
+        self.other.execute('BEGIN IMMEDIATE')
+        self.other.execute(
+            f'INSERT INTO {PricePrediction._meta.db_table} '
+            '(session_token, name, square_footage, bedrooms, predicted_price, created_at, updated_at) '
+            "VALUES ('active', '', 2000, 3, 300000, datetime('now'), datetime('now'))"
+        )
+        self.commit_later()
+        with CaptureQueriesContext(connections['shard_1']) as queries:
+            purged = purge_expired_sessions(retention_cutoff(90), pause=0, using='shard_1')
+        self.assertEqual(purged, (1, 2))
+        self.assertEqual(list(PricePrediction.objects.using('shard_1').values_list('session_token', flat=True)), ['active'])
+        batches = [query['sql'] for query in queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(batches), 3)
+        self.assertIn('LIMIT 500', batches[0])
+
+    def test_delete_that_loses_the_race_leaves_rollup_alone(self):
+        """Test that a delete of a row another connection deleted first is not found and leaves the rollup alone"""
+        self.other.execute('BEGIN IMMEDIATE')
+        self.other.execute(f'DELETE FROM {PricePrediction._meta.db_table} WHERE id = ?', [self.prediction['id']])
+        self.other.execute(REFRESH_SUMMARY_SQL, [self.session])
+        self.commit_later()
+        response = self.client.delete(self.url('session-delete'))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(SessionSummary.objects.using('shard_1').get(pk=self.session).prediction_count, 1)
+        self.assertEqual(find_summary_drift(), [])
+
+
+@override_settings(
+    PREDICTIONS_REPLICAS_ENABLED=True,
+    PREDICTIONS_SHARD_COUNT=1,
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'replica_pins': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-pins'},
+    },
+)
+class ReplicaTests(SimpleTestCase):
+    """Tests for replica reads, primary pinning and replica refreshes"""
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.primary_path = Path(tmpdir.name) / 'primary.sqlite3'
+        self.replica_path = Path(tmpdir.name) / 'replica.sqlite3'
+        databases = mock.patch.dict(connections.databases, {
+            'replica_default': {**connections.databases['default'], 'NAME': self.replica_path},
+            'replica_test_primary': {**connections.databases['default'], 'NAME': self.replica_path},
+            'test_primary': {**connections.databases['default'], 'NAME': self.primary_path},
+        })
+        databases.start()
+        self.addCleanup(databases.stop)
+
+    def test_reads_use_current_replica(self):
+        """Test that reads go to a recently refreshed replica"""
+        self.replica_path.touch()
+        self.assertEqual(read_alias('replica-session'), 'replica_default')
+
+    def test_reads_fall_back_to_primary_when_replica_missing_or_stale(self):
+        """Test that a missing or lagging replica is not read from"""
+        self.assertEqual(read_alias('replica-session'), 'default')
+        self.replica_path.touch()
+        stale = time.time() - settings.PREDICTIONS_REPLICA_MAX_LAG - 1
+        os.utime(self.replica_path, (stale, stale))
+        self.assertEqual(read_alias('replica-session'), 'default')
+
+    def test_writes_pin_session_to_primary(self):
+        """Test that a session reads from the primary until the replica is refreshed after its write"""
+        self.replica_path.touch()
+        refreshed = time.time() - 1
+        os.utime(self.replica_path, (refreshed, refreshed))
+        pin_to_primary('writer-session')
+        self.assertEqual(read_alias('writer-session'), 'default')
+        self.assertEqual(read_alias('other-session'), 'replica_default')
+
+        refreshed = time.time() + 1
+        os.utime(self.replica_path, (refreshed, refreshed))
+        self.assertEqual(read_alias('writer-session'), 'replica_default')
+
+    def test_pin_outlasts_replica_lag(self):
+        """Test that a pin is kept for as long as a replica may lag behind the primary"""
+        with mock.patch('predictions.replicas.caches') as cache:
+            pin_to_primary('writer-session')
+        self.assertEqual(cache['replica_pins'].set.call_args.kwargs['timeout'], settings.PREDICTIONS_REPLICA_MAX_LAG)
+
+    def test_reads_use_primary_when_disabled(self):
+        """Test that replicas are ignored unless enabled"""
+        self.replica_path.touch()
+        with override_settings(PREDICTIONS_REPLICAS_ENABLED=False):
+            self.assertEqual(read_alias('replica-session'), 'default')
+
+    def test_router_writes_replica_instances_to_primary(self):
+        """Test that instances loaded from a replica are saved to the primary and replicas are not migrated"""
+        router = ReplicaRouter()
+        prediction = PricePrediction(session_token='replica-session')
+        self.assertIsNone(router.db_for_write(PricePrediction, instance=prediction))
+        prediction._state.db = 'replica_shard_1'
+        self.assertEqual(router.db_for_write(PricePrediction, instance=prediction), 'shard_1')
+        self.assertFalse(router.allow_migrate('replica_default', 'predictions'))
+        self.assertIsNone(router.allow_migrate('default', 'predictions'))
+
+    def test_refresh_copies_primary(self):
+        """Test that a refresh replaces the replica with a consistent copy of the primary"""
+        with sqlite3.connect(self.primary_path) as conn:
+            conn.execute('CREATE TABLE t (x INTEGER)')
+            conn.execute('INSERT INTO t VALUES (1), (2)')
+        conn.close()
+        before = time.time()
+        self.assertTrue(refresh_replica('test_primary'))
+        conn = sqlite3.connect(self.replica_path)
+        self.assertEqual(conn.execute('SELECT count(*) FROM t').fetchone()[0], 2)
+        conn.close()
+        self.assertGreaterEqual(os.path.getmtime(self.replica_path), int(before))
+        self.assertEqual(list(self.replica_path.parent.glob('*.tmp')), [])
+        self.assertFalse(refresh_replica('shard_7'))
+
+
+class SnapshotTests(TestCase):
+    """Tests for the columnar prediction snapshot and its query API"""
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.directory = Path(tmpdir.name)
+        for token, square_footage, bedrooms, price in [
+            ('snap-a', 1000, 2, 100000),
+            ('snap-a', 2000, 3, 300000),
+            ('snap-b', 1500, 3, 200000),
+        ]:
+            PricePrediction.objects.create(
+                session_token=token, square_footage=square_footage, bedrooms=bedrooms, predicted_price=price,
+            )
+
+    def test_snapshot_copies_columns(self):
+        """Test that every prediction is written with its session dictionary-encoded"""
+        self.assertEqual(update_snapshot(self.directory), 3)
+        snapshot = PredictionSnapshot(self.directory)
+        self.assertEqual(len(snapshot), 3)
+        self.assertEqual(sorted(snapshot.predicted_price.tolist()), [100000, 200000, 300000])
+        self.assertEqual(sorted(snapshot.sessions), ['snap-a', 'snap-b'])
+        self.assertEqual(
+            sorted(snapshot.sessions[code] for code in snapshot.session), ['snap-a', 'snap-a', 'snap-b'],
+        )
+        first = PricePrediction.objects.order_by('id').first()
+        self.assertAlmostEqual(snapshot.created_at[0], first.created_at.timestamp(), places=3)
+
+    def test_snapshot_is_incremental(self):
+        """Test that later runs only append predictions past the last snapshotted id"""
+        update_snapshot(self.directory)
+        self.assertEqual(update_snapshot(self.directory), 0)
+        PricePrediction.objects.create(
+            session_token='snap-c', square_footage=900, bedrooms=1, predicted_price=90000,
+        )
+        self.assertEqual(update_snapshot(self.directory, chunk_size=1), 1)
+        snapshot = PredictionSnapshot(self.directory)
+        self.assertEqual(len(snapshot), 4)
+        self.assertEqual(snapshot.predicted_price[-1], 90000)
+        self.assertEqual(update_snapshot(self.directory, rebuild=True), 4)
+
+    def test_uncommitted_bytes_are_discarded(self):
+        """Test that bytes written by an interrupted run are truncated before appending"""
+        update_snapshot(self.directory)
+        with open(self.directory / 'predicted_price.bin', 'ab') as f:
+            f.write(b'partial')
+        PricePrediction.objects.create(
+            session_token='snap-c', square_footage=900, bedrooms=1, predicted_price=90000,
+        )
+        update_snapshot(self.directory)
+        for name, dtype in COLUMNS.items():
+            self.assertEqual((self.directory / f'{name}.bin').stat().st_size, 4 * dtype.itemsize)
+        self.assertEqual(PredictionSnapshot(self.directory).predicted_price[-1], 90000)
+
+    def test_filters_and_aggregates(self):
+        """Test vectorized filters, summaries and grouping over the snapshot"""
+        update_snapshot(self.directory)
+        snapshot = PredictionSnapshot(self.directory)
+        summary = snapshot.summarize(snapshot.where(bedrooms=3))
+        self.assertEqual(summary['count'], 2)
+        self.assertEqual(summary['mean_price'], 250000)
+        self.assertEqual(snapshot.summarize(snapshot.where(square_footage=(1200, None)))['min_price'], 200000)
+        self.assertEqual(snapshot.summarize(snapshot.where(session_token='snap-a'))['median_price'], 200000)
+        self.assertEqual(snapshot.summarize(snapshot.where(session_token='missing'))['count'], 0)
+        self.assertEqual(
+            snapshot.group_by('session'),
+            {'snap-a': {'count': 2, 'mean_price': 200000}, 'snap-b': {'count': 1, 'mean_price': 200000}},
+        )
+        with self.assertRaises(ValueError):
+            snapshot.where(name='x')
+
+    def test_command_reports_rows(self):
+        """Test that the snapshot command appends and reports the total"""
+        out = StringIO()
+        call_command('snapshot_predictions', '--dir', str(self.directory), stdout=out)
+        self.assertIn('Appended 3 predictions', out.getvalue())
+        self.assertIn('3 rows', out.getvalue())
+
+
+class _DoubleModel:
+    """Candidate model that predicts twice the square footage, optionally waiting for a signal first."""
+
+    def __init__(self, release=None):
+        self.release = release
+        self.batches = []
+
+    def predict(self, features):
+        if self.release is not None:
+            self.release.wait(5)
+        self.batches.append(len(features))
+        return features[:, 0] * 2
+
+
+class ShadowScoringTests(SimpleTestCase):
+    """Tests for background shadow scoring of candidate models"""
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.log_path = Path(tmpdir.name) / 'shadow.jsonl'
+
+    def read_log(self):
+        with open(self.log_path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_inputs_are_scored_in_micro_batches(self):
+        """Test that queued inputs are scored together and logged with the live prices"""
+        model = _DoubleModel()
+        scorer = ShadowScorer({'double': model}, self.log_path, batch_size=10, batch_wait=0.5)
+        for i in range(5):
+            self.assertTrue(scorer.submit(1000 + i, 3, 100000))
+        scorer.flush()
+        self.assertEqual(sum(model.batches), 5)
+        self.assertLess(len(model.batches), 5)
+        records = self.read_log()
+        self.assertEqual(sum(len(record['primary']) for record in records), 5)
+        self.assertEqual(records[0]['inputs'][0], [1000, 3])
+        self.assertEqual(records[0]['primary'][0], 100000)
+        self.assertEqual(records[0]['candidates']['double'][0], 2000)
+        self.assertEqual(scorer.stats(), {'submitted': 5, 'scored': 5, 'dropped': 0, 'queued': 0})
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test that submits never wait on a busy scorer and drops are counted and logged"""
+        release = threading.Event()
+        scorer = ShadowScorer({'slow': _DoubleModel(release)}, self.log_path, queue_size=1, batch_wait=0)
+        scorer.submit(1000, 3, 100000)
+        deadline = time.monotonic() + 5
+        while scorer.stats()['queued'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(scorer.submit(1100, 3, 110000))
+
+        started = time.monotonic()
+        self.assertFalse(scorer.submit(1200, 3, 120000))
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(scorer.stats()['dropped'], 1)
+
+        with self.assertLogs('predictions.shadow', level='WARNING'):
+            release.set()
+            scorer.flush()
+        self.assertEqual(sum(record['dropped'] for record in self.read_log()), 1)
+
+    def test_failing_candidate_does_not_stop_scoring(self):
+        """Test that a candidate that cannot be loaded is skipped"""
+        scorer = ShadowScorer({'missing': 'predictions.no_such_model', 'double': _DoubleModel()}, self.log_path)
+        with self.assertLogs('predictions.shadow', level='ERROR'):
+            scorer.submit(1000, 3, 100000)
+            scorer.flush()
+        self.assertEqual(list(self.read_log()[0]['candidates']), ['double'])
+
+    def test_predictions_are_submitted_for_shadow_scoring(self):
+        """Test that predict_home_price hands its inputs and answer to the scorer"""
+        scorer = mock.Mock()
+        with mock.patch('predictions.shadow.get_shadow_scorer', return_value=scorer):
+            price = predict_home_price(2000, 3)
+        scorer.submit.assert_called_once_with(2000, 3, price)
+
+    def test_report_summarizes_candidates(self):
+        """Test that the shadow report lists each candidate and the drop count"""
+        scorer = ShadowScorer({'double': _DoubleModel()}, self.log_path)
+        scorer.submit(1000, 3, 1500)
+        scorer.flush()
+        out = StringIO()
+        call_command('shadow_report', '--log', str(self.log_path), stdout=out)
+        self.assertIn('double', out.getvalue())
+        self.assertIn('500.00', out.getvalue())
+        self.assertIn('1 inputs shadow scored, 0 dropped', out.getvalue())
+
+
+class PricingJobTests(TestCase):
+    """Tests for bulk CSV pricing jobs"""
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        overrides = override_settings(PREDICTIONS_JOBS_DIR=Path(tmpdir.name))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client = APIClient()
+        self.csv = (
+            'name,square_footage,bedrooms\n'
+            'first,2000,3\n'
+            'bad,abc,3\n'
+            '\n'
+            '"big, house",600000,4\n'
+            'last,1500,2\n'
+        ).encode()
+
+    def upload(self, body, session_token='job-session'):
+        return self.client.generic(
+            'POST', f'/api/predictions/pricing-jobs/?session_token={session_token}', body, content_type='text/csv',
+        )
+
+    def read_result(self, job):
+        with open(jobs.result_path(job), newline='') as f:
+            return list(csv.reader(f))
+
+    def test_validate_features_matches_create_rules(self):
+        """Test that batch validation reports the same first error as the create endpoint"""
+        square_footage, bedrooms, errors = jobs.validate_features(
+            ['2000', '', 'x', '0', '100', '600000', '100', '1e3'],
+            ['3', '3', '3', '3', '0', '3', '301', '3.5'],
+        )
+        self.assertEqual(list(errors), [
+            '',
+            'square_footage and bedrooms are required',
+            'square_footage must be a number and bedrooms must be an integer',
+            'square_footage must be greater than 0',
+            'bedrooms must be greater than 0',
+            'square_footage cannot exceed 500,000',
+            'bedrooms cannot exceed 300',
+            'square_footage must be a number and bedrooms must be an integer',
+        ])
+        self.assertEqual(square_footage[0], 2000)
+        self.assertEqual(bedrooms[0], 3)
+
+    def test_upload_process_and_download(self):
+        """Test the job lifecycle from upload through progress to the streamed result"""
+        response = self.upload(self.csv)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'queued')
+        status_url = response['Location']
+        job_id = response.data['id']
+
+        response = self.client.get(f'/api/predictions/pricing-jobs/{job_id}/result/?session_token=job-session')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        self.assertEqual(jobs.run_pending_jobs(chunk_size=2), 1)
+        response = self.client.get(f'{status_url}?session_token=job-session')
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual(response.data['progress'], 1.0)
+        self.assertEqual(response.data['rows_processed'], 4)
+        self.assertEqual(response.data['rows_failed'], 2)
+
+        response = self.client.get(f"{response.data['result_url']}?session_token=job-session")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], jobs.RESULT_COLUMNS)
+        self.assertEqual([row[1] for row in rows[1:]], ['first', 'bad', 'big, house', 'last'])
+        self.assertAlmostEqual(float(rows[1][4]), predict_home_price(2000, 3), places=1)
+        self.assertEqual(rows[2][4:], ['', 'square_footage must be a number and bedrooms must be an integer'])
+        self.assertEqual(rows[3][5], 'square_footage cannot exceed 500,000')
+
+    def test_jobs_belong_to_their_session(self):
+        """Test that another session cannot see a job"""
+        job_id = self.upload(self.csv).data['id']
+        response = self.client.get(f'/api/predictions/pricing-jobs/{job_id}/?session_token=other-session')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(f'/api/predictions/pricing-jobs/{job_id}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_upload_validation(self):
+        """Test that uploads need a session token and a body within the size limit"""
+        self.assertEqual(self.upload(self.csv, session_token='').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.upload(b'').status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(PREDICTIONS_JOB_MAX_UPLOAD_BYTES=10):
+            response = self.upload(self.csv)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertFalse(PricingJob.objects.exists())
+
+    def test_missing_columns_fail_the_job(self):
+        """Test that a file without the required header columns fails with an error"""
+        self.upload(b'name,size\nx,1\n')
+        jobs.run_pending_jobs()
+        job = PricingJob.objects.get()
+        self.assertEqual(job.status, PricingJob.FAILED)
+        self.assertIn('bedrooms', job.error)
+
+    def test_unparseable_rows_fail_the_job(self):
+        """Test that a CSV error or an unexpected exception fails the job instead of leaving it running"""
+        self.upload(b'name,square_footage,bedrooms\n' + b'x' * 131073 + b',2000,3\n')
+        self.assertEqual(jobs.run_pending_jobs(), 1)
+        job = PricingJob.objects.get()
+        self.assertEqual(job.status, PricingJob.FAILED)
+        self.assertIn('field larger than field limit', job.error)
+        self.assertIsNone(jobs.claim_job(stale_seconds=0))
+
+        job.delete()
+        self.upload(self.csv)
+        with mock.patch('predictions.jobs.predict_home_prices', side_effect=ValueError('bad model')), \
+                self.assertLogs('predictions.jobs', 'ERROR'):
+            jobs.run_pending_jobs()
+        job = PricingJob.objects.get()
+        self.assertEqual(job.status, PricingJob.FAILED)
+        self.assertEqual(job.error, 'Unexpected error: bad model')
+
+    def test_interrupted_job_resumes_after_last_chunk(self):
+        """Test that a stale running job is reclaimed and finishes without duplicating rows"""
+        self.upload(self.csv)
+        real_price_chunk = jobs.price_chunk
+        calls = []
+
+        def crash_on_second_chunk(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise SystemExit('worker killed')
+            return real_price_chunk(*args, **kwargs)
+
+        with mock.patch('predictions.jobs.price_chunk', side_effect=crash_on_second_chunk):
+            with self.assertRaises(SystemExit):
+                jobs.run_pending_jobs(chunk_size=2)
+
+        job = PricingJob.objects.get()
+        self.assertEqual(job.status, PricingJob.RUNNING)
+        self.assertEqual(job.rows_processed, 2)
+        with open(jobs.result_path(job), 'ab') as f:
+            f.write(b'unrecorded output\n')
+
+        self.assertIsNone(jobs.claim_job())
+        PricingJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(jobs.run_pending_jobs(chunk_size=2), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, PricingJob.COMPLETED)
+        self.assertEqual(job.rows_processed, 4)
+        rows = self.read_result(job)
+        self.assertEqual([row[0] for row in rows], ['row', '1', '2', '3', '4'])
+
+    def test_worker_command_reports_jobs(self):
+        """Test that the worker command processes waiting jobs"""
+        self.upload(self.csv)
+        out = StringIO()
+        call_command('run_pricing_jobs', stdout=out)
+        self.assertIn('completed, 4 rows (2 invalid)', out.getvalue())
+
+
+class ResponseFormatTests(TestCase):
+    """Tests for field projection, compact encodings and response compression"""
+
+    def setUp(self):
+        self.client = APIClient()
+        for i in range(20):
+            PricePrediction.objects.create(
+                session_token='format-session', name=f'Home {i}', square_footage=1000 + i, bedrooms=3,
+                predicted_price=200000 + i,
+            )
+        self.url = '/api/predictions/session-data/?session_token=format-session'
+
+    def test_fields_projection_narrows_query_and_response(self):
+        """Test that ?fields= selects and returns only the requested fields"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'{self.url}&fields=id,predicted_price')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data[0]), {'id', 'predicted_price'})
+        self.assertEqual(len(response.data), 20)
+        self.assertNotIn('updated_at', queries.captured_queries[-1]['sql'])
+
+    def test_unknown_field_is_rejected(self):
+        """Test that an unknown projection field is a bad request"""
+        response = self.client.get(f'{self.url}&fields=id,secret')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_columnar_json(self):
+        """Test that the columnar encoding is chosen by Accept header or format parameter"""
+        response = self.client.get(f'{self.url}&fields=name,bedrooms', HTTP_ACCEPT='application/vnd.columnar+json')
+        self.assertEqual(response['Content-Type'], 'application/vnd.columnar+json')
+        body = json.loads(response.content)
+        self.assertEqual(body['count'], 20)
+        self.assertEqual(set(body['columns']), {'name', 'bedrooms'})
+        self.assertEqual(body['columns']['bedrooms'], [3] * 20)
+        self.assertEqual(json.loads(self.client.get(f'{self.url}&format=columnar').content)['count'], 20)
+
+    def test_default_response_is_unchanged(self):
+        """Test that clients without preferences get the full JSON rows"""
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(len(response.data[0]), 8)
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        """Test that MessagePack is offered when msgpack is installed"""
+        response = self.client.get(self.url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(len(msgpack.unpackb(response.content)), 20)
+
+    def test_large_responses_are_gzipped(self):
+        """Test that responses above the threshold are compressed for clients that accept gzip"""
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))), 20)
+        self.assertFalse(self.client.get(self.url).has_header('Content-Encoding'))
+
+    def test_small_responses_are_not_compressed(self):
+        """Test that responses below the threshold are sent as they are"""
+        response = self.client.get(f'{self.url}&fields=id&format=columnar', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli_is_preferred(self):
+        """Test that Brotli is used when the client accepts it"""
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, br')
+        middleware = CompressionMiddleware(lambda request: HttpResponse('x' * 5000, content_type='text/plain'))
+        response = middleware(request)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), b'x' * 5000)
@@ -0,0 +1,171 @@
+"""
+Per-client rate limiting for the predictions API.
+
+This module provides a DRF throttle that keeps two in-process token buckets
+per endpoint: one per (session_token, client IP) and one per client IP. A
+request must get a token from both, so a client cannot escape its limit by
+sending a new session token with every request. Rates are configured per
+URL name in PREDICTIONS_THROTTLE_RATES, and the number of buckets held in
+memory is capped by PREDICTIONS_THROTTLE_MAX_KEYS, evicting the least
+recently used ones first.
+
+Buckets live in each worker process's memory. The configured rates are for
+the whole server, so each process enforces 1/PREDICTIONS_THROTTLE_WORKERS of
+them (gunicorn.conf.py sets this to its worker count). A client whose
+requests are spread unevenly over the workers may be limited somewhat
+earlier than the configured rate, never later.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    Parse a DRF-style rate string such as '30/min' into tokens per second.
+
+    Only the first letter of the period is significant, as in DRF.
+    """
+    num, period = rate.split('/')
+    return int(num) / _PERIODS[period[0]]
+
+
+class TokenBucket:
+    """A token bucket refilled continuously at `rate` tokens per second up to `capacity`."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def consume(self, now):
+        """
+        Take one token if available.
+
+        Returns 0 when the request is allowed, otherwise the number of seconds
+        until a token will be available.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class BucketStore:
+    """Thread-safe, size-bounded map of token buckets with LRU eviction."""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def consume(self, key, rate, capacity, now=None):
+        """Consume a token from the bucket for `key`, creating it if needed."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(rate, capacity, now)
+                self._buckets[key] = bucket
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.consume(now)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+_store = BucketStore(getattr(settings, 'PREDICTIONS_THROTTLE_MAX_KEYS', 10000))
+
+
+def get_bucket_store():
+    """Return the process-wide bucket store."""
+    return _store
+
+
+class SessionRateThrottle(BaseThrottle):
+    """
+    Token-bucket throttle keyed by endpoint, session token and client IP.
+
+    The endpoint is the resolved URL name (e.g. 'prediction-list',
+    'session-data'); endpoints without an entry in PREDICTIONS_THROTTLE_RATES
+    use the 'default' entry, and an entry of None disables throttling.
+    'rate'/'burst' limit each session on an IP and 'ip_rate'/'ip_burst'
+    limit the IP as a whole.
+    """
+
+    def __init__(self):
+        self._wait = None
+
+    def get_rate(self, request):
+        """
+        Return the scope and its limits for this endpoint.
+
+        Limits are (session rate, session burst, IP rate, IP burst) in tokens
+        per second and bucket capacity for this worker process; the IP pair
+        is None when the scope has no IP limit, and the whole tuple is None
+        when it is unthrottled.
+        """
+        rates = getattr(settings, 'PREDICTIONS_THROTTLE_RATES', {})
+        match = request.resolver_match
+        scope = match.url_name if match and match.url_name in rates else 'default'
+        config = rates.get(scope)
+        if not config:
+            return scope, None
+        workers = max(1, getattr(settings, 'PREDICTIONS_THROTTLE_WORKERS', 1))
+
+        def per_worker(rate, burst):
+            return parse_rate(rate) / workers, math.ceil(burst / workers)
+
+        rate, burst = per_worker(config['rate'], config['burst'])
+        ip_rate = ip_burst = None
+        if config.get('ip_rate'):
+            ip_rate, ip_burst = per_worker(config['ip_rate'], config['ip_burst'])
+        return scope, (rate, burst, ip_rate, ip_burst)
+
+    def get_session_token(self, request):
+        """
+        Read the session token from the query string or the request body.
+
+        The body is only read when one of the view's parsers accepts it
+        (JSON, form or multipart), so bodies a view streams itself, such as
+        CSV uploads, are left untouched.
+        """
+        token = request.query_params.get('session_token')
+        if not token and request.negotiator.select_parser(request, request.parsers) is not None:
+            data = request.data
+            if hasattr(data, 'get'):
+                token = data.get('session_token')
+        return str(token or '')
+
+    def allow_request(self, request, view):
+        scope, limits = self.get_rate(request)
+        if limits is None:
+            return True
+        rate, burst, ip_rate, ip_burst = limits
+        ident = self.get_ident(request)
+        self._wait = _store.consume((scope, self.get_session_token(request), ident), rate, burst)
+        if self._wait == 0 and ip_rate:
+            self._wait = _store.consume((scope, None, ident), ip_rate, ip_burst)
+        return self._wait == 0
+
+    def wait(self):
+        return self._wait
@@ -9,7 +9,11 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     PricePredictionViewSet,
+    create_pricing_job,
+    pricing_job_result,
+    pricing_job_status,
     session_predictions,
+    session_summary,
     session_update_prediction,
     session_delete_prediction
 )
@@ -19,7 +23,11 @@ router.register(r'', PricePredictionViewSet, basename='prediction')
 
 urlpatterns = [
     path('session-data/', session_predictions, name='session-data'),
+    path('session-summary/', session_summary, name='session-summary'),
     path('session-update/<int:pk>/', session_update_prediction, name='session-update'),
     path('session-delete/<int:pk>/', session_delete_prediction, name='session-delete'),
+    path('pricing-jobs/', create_pricing_job, name='pricing-jobs'),
+    path('pricing-jobs/<uuid:pk>/', pricing_job_status, name='pricing-job'),
+    path('pricing-jobs/<uuid:pk>/result/', pricing_job_result, name='pricing-job-result'),
     path('', include(router.urls)),
 ]
@@ -2,15 +2,30 @@
 REST API views for predictions app.
 
 This module contains REST API endpoints for managing home price predictions
-with session-based access control.
+with session-based access control. Every session-scoped query is routed to
+the shard that holds the session (see predictions.sharding); history and
+summary reads use that shard's read replica when one is configured
+(see predictions.replicas). Bulk CSV pricing jobs are queued here and
+processed by `manage.py run_pricing_jobs` (see predictions.jobs).
 """
 
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
-from .models import PricePrediction
-from .serializers import PricePredictionSerializer
+from .models import PricePrediction, PricingJob
+from . import jobs, rollups
+from .serializers import PricePredictionSerializer, PricingJobSerializer
 from .predictor import predict_home_price
+from .renderers import compact_renderer_classes
+from .replicas import pin_to_primary, read_alias, read_alias_for_shard
+from .sharding import configured_shard_aliases, shard_for
+from .summaries import DEFAULT_BUCKETS, MAX_BUCKETS, rollup_stats, summarize_predictions
 
 
 class PricePredictionViewSet(viewsets.ModelViewSet):
@@ -18,6 +33,10 @@ class PricePredictionViewSet(viewsets.ModelViewSet):
     ViewSet for home price predictions.
     
     create: Create a new prediction (POST with square_footage, bedrooms, and session_token)
+
+    Updates and deletes go through session-update/ and session-delete/, which
+    check the session token, route to the session's shard and maintain the
+    rollup; the generic detail routes are disabled.
     """
     queryset = PricePrediction.objects.all()
     serializer_class = PricePredictionSerializer
@@ -36,6 +55,27 @@ class PricePredictionViewSet(viewsets.ModelViewSet):
             status=status.HTTP_405_METHOD_NOT_ALLOWED
         )
 
+    def update(self, request, *args, **kwargs):
+        """Update endpoint is disabled; use session-update/."""
+        return Response(
+            {'error': 'Not available'},
+            status=status.HTTP_405_METHOD_NOT_ALLOWED
+        )
+
+    def partial_update(self, request, *args, **kwargs):
+        """Partial update endpoint is disabled; use session-update/."""
+        return Response(
+            {'error': 'Not available'},
+            status=status.HTTP_405_METHOD_NOT_ALLOWED
+        )
+
+    def destroy(self, request, *args, **kwargs):
+        """Destroy endpoint is disabled; use session-delete/."""
+        return Response(
+            {'error': 'Not available'},
+            status=status.HTTP_405_METHOD_NOT_ALLOWED
+        )
+
     def create(self, request, *args, **kwargs):
         """
         Create a new prediction.
@@ -98,24 +138,32 @@ class PricePredictionViewSet(viewsets.ModelViewSet):
         predicted_price = predict_home_price(square_footage, bedrooms)
 
         # Save to database
-        prediction = PricePrediction.objects.create(
-            session_token=session_token,
-            name=name,
-            square_footage=square_footage,
-            bedrooms=bedrooms,
-            predicted_price=predicted_price
-        )
+        shard = shard_for(session_token)
+        with transaction.atomic(using=shard):
+            prediction = PricePrediction.objects.using(shard).create(
+                session_token=session_token,
+                name=name,
+                square_footage=square_footage,
+                bedrooms=bedrooms,
+                predicted_price=predicted_price
+            )
+            rollups.record_created(prediction, using=shard)
+        pin_to_primary(session_token)
 
         serializer = self.get_serializer(prediction)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
 @api_view(['GET'])
+@renderer_classes(compact_renderer_classes())
 def session_predictions(request):
     """
     Get predictions for the current session.
     Filters predictions by session_token.
     Expected: /api/predictions/session-data/?session_token=<user_session_token>
+    Optional: fields=<comma-separated field names> to return only those fields
+              Accept: application/vnd.columnar+json (or format=columnar) for one array per field,
+              application/msgpack (or format=msgpack) for MessagePack
     """
     session_token = request.query_params.get('session_token', '')
 
@@ -125,11 +173,91 @@ def session_predictions(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    predictions = PricePrediction.objects.filter(session_token=session_token)
-    serializer = PricePredictionSerializer(predictions, many=True)
+    predictions = PricePrediction.objects.using(read_alias(session_token)).filter(session_token=session_token)
+
+    # Only select and send the requested fields
+    fields = None
+    if request.query_params.get('fields'):
+        fields = [name.strip() for name in request.query_params['fields'].split(',') if name.strip()]
+        unknown = [name for name in fields if name not in PricePredictionSerializer.Meta.fields]
+        if unknown or not fields:
+            return Response(
+                {'error': f"fields must be a comma-separated list of: {', '.join(PricePredictionSerializer.Meta.fields)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        predictions = predictions.only(*fields)
+
+    serializer = PricePredictionSerializer(predictions, many=True, fields=fields)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+def session_summary(request):
+    """
+    Get aggregate statistics for a session's predictions, or for all sessions.
+    Returns count, min/max/mean/median predicted price and a price histogram.
+    Expected: /api/predictions/session-summary/?session_token=<token>
+              /api/predictions/session-summary/?all=true&since=<iso datetime>&until=<iso datetime>
+    Optional: buckets=<number of histogram buckets, default 10>
+              detail=false to skip the median and histogram
+    """
+    session_token = request.query_params.get('session_token', '')
+    all_sessions = request.query_params.get('all', '').lower() in ('true', '1', 'yes')
+    detail = request.query_params.get('detail', 'true').lower() not in ('false', '0', 'no')
+
+    if not session_token and not all_sessions:
+        return Response(
+            {'error': 'session_token query parameter is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        buckets = int(request.query_params.get('buckets', DEFAULT_BUCKETS))
+    except ValueError:
+        return Response(
+            {'error': 'buckets must be an integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not 1 <= buckets <= MAX_BUCKETS:
+        return Response(
+            {'error': f'buckets must be between 1 and {MAX_BUCKETS}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if session_token:
+        aliases = [read_alias(session_token)]
+        predictions = [PricePrediction.objects.using(aliases[0]).filter(session_token=session_token)]
+    else:
+        aliases = [read_alias_for_shard(alias) for alias in configured_shard_aliases()]
+        predictions = [PricePrediction.objects.using(alias).all() for alias in aliases]
+
+    windowed = False
+    for param, lookup in (('since', 'created_at__gte'), ('until', 'created_at__lt')):
+        value = request.query_params.get(param)
+        if not value:
+            continue
+        windowed = True
+        try:
+            moment = parse_datetime(value)
+        except ValueError:
+            moment = None
+        if moment is None:
+            return Response(
+                {'error': f'{param} must be an ISO 8601 datetime'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        predictions = [queryset.filter(**{lookup: moment}) for queryset in predictions]
+
+    # Without a time window the basic statistics come straight from the rollup
+    stats = None if windowed else rollup_stats(session_token, using=aliases[0], aliases=aliases)
+    return Response(
+        summarize_predictions(predictions, buckets, stats=stats, detail=detail),
+        status=status.HTTP_200_OK
+    )
+
+
 @api_view(['PATCH', 'PUT'])
 def session_update_prediction(request, pk):
     """
@@ -145,8 +273,9 @@ def session_update_prediction(request, pk):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    shard = shard_for(session_token)
     try:
-        prediction = PricePrediction.objects.get(pk=pk, session_token=session_token)
+        prediction = PricePrediction.objects.using(shard).get(pk=pk, session_token=session_token)
     except PricePrediction.DoesNotExist:
         return Response(
             {'error': 'Prediction not found or does not belong to this session'},
@@ -208,7 +337,23 @@ def session_update_prediction(request, pk):
             prediction.bedrooms
         )
 
-    prediction.save()
+    with transaction.atomic(using=shard):
+        # SQLite transactions start deferred: write first to take the shard's
+        # write lock, then read the price being replaced as of this
+        # transaction, in case another request changed it since the read above
+        predictions = PricePrediction.objects.using(shard).filter(pk=pk, session_token=session_token)
+        if not predictions.update(updated_at=timezone.now()):
+            return Response(
+                {'error': 'Prediction not found or does not belong to this session'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        old_price = predictions.values_list('predicted_price', flat=True).get()
+        prediction.save(
+            using=shard,
+            update_fields=['name', 'square_footage', 'bedrooms', 'predicted_price', 'updated_at'],
+        )
+        rollups.record_updated(prediction, old_price, using=shard)
+    pin_to_primary(session_token)
     serializer = PricePredictionSerializer(prediction)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -221,6 +366,59 @@ def session_delete_prediction(request, pk):
     """
     session_token = request.query_params.get('session_token', '')
 
+    if not session_token:
+        return Response(
+            {'error': 'session_token query parameter is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    shard = shard_for(session_token)
+    with transaction.atomic(using=shard):
+        # Write first so this deferred SQLite transaction holds the shard's
+        # write lock before it reads the row; a request that lost the race
+        # to another delete finds nothing and leaves the rollup alone
+        predictions = PricePrediction.objects.using(shard).filter(pk=pk, session_token=session_token)
+        deleted = predictions.update(updated_at=timezone.now())
+        if deleted:
+            prediction = predictions.get()
+            predictions.delete()
+            rollups.record_deleted(prediction, using=shard)
+
+    if not deleted:
+        return Response(
+            {'error': 'Prediction not found or does not belong to this session'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    pin_to_primary(session_token)
+    return Response(
+        {'message': 'Prediction deleted successfully'},
+        status=status.HTTP_204_NO_CONTENT
+    )
+
+
+UPLOAD_READ_SIZE = 64 * 1024
+
+
+def _upload_chunks(request):
+    """Yield an uploaded CSV file: a multipart 'file' field or the raw request body."""
+    if request.content_type.startswith('multipart/form-data'):
+        yield from request.FILES['file'].chunks()
+        return
+    while chunk := request.stream.read(UPLOAD_READ_SIZE):
+        yield chunk
+
+
+@api_view(['POST'])
+def create_pricing_job(request):
+    """
+    Upload a CSV file of homes to be priced in the background.
+    Expected: POST /api/predictions/pricing-jobs/?session_token=<token>
+              with a text/csv body (or a multipart 'file' field) whose header row
+              names square_footage and bedrooms columns, and optionally name
+    Returns the queued job; poll /api/predictions/pricing-jobs/<id>/ for progress.
+    """
+    session_token = request.query_params.get('session_token', '')
+
     if not session_token:
         return Response(
             {'error': 'session_token query parameter is required'},
@@ -228,14 +426,84 @@ def session_delete_prediction(request, pk):
         )
 
     try:
-        prediction = PricePrediction.objects.get(pk=pk, session_token=session_token)
-        prediction.delete()
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > settings.PREDICTIONS_JOB_MAX_UPLOAD_BYTES:
         return Response(
-            {'message': 'Prediction deleted successfully'},
-            status=status.HTTP_204_NO_CONTENT
+            {'error': f'CSV file cannot exceed {settings.PREDICTIONS_JOB_MAX_UPLOAD_BYTES} bytes'},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
         )
-    except PricePrediction.DoesNotExist:
+    multipart = request.content_type.startswith('multipart/form-data')
+    if not content_length or (multipart and 'file' not in request.FILES):
         return Response(
-            {'error': 'Prediction not found or does not belong to this session'},
+            {'error': 'A CSV file is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        job = jobs.create_job(session_token, _upload_chunks(request))
+    except jobs.UploadTooLarge:
+        return Response(
+            {'error': f'CSV file cannot exceed {settings.PREDICTIONS_JOB_MAX_UPLOAD_BYTES} bytes'},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    return Response(
+        PricingJobSerializer(job).data,
+        status=status.HTTP_202_ACCEPTED,
+        headers={'Location': reverse('pricing-job', args=[job.pk])}
+    )
+
+
+def _session_job(request, pk):
+    """Return the job with `pk` if it belongs to the request's session, else None."""
+    session_token = request.query_params.get('session_token', '')
+    if not session_token:
+        return None
+    return PricingJob.objects.filter(pk=pk, session_token=session_token).first()
+
+
+@api_view(['GET'])
+def pricing_job_status(request, pk):
+    """
+    Get the status and progress of a bulk pricing job.
+    Requires session_token query parameter matching the job's session token.
+    """
+    job = _session_job(request, pk)
+    if job is None:
+        return Response(
+            {'error': 'Job not found or does not belong to this session'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    data = PricingJobSerializer(job).data
+    if job.status == PricingJob.COMPLETED:
+        data['result_url'] = reverse('pricing-job-result', args=[job.pk])
+    return Response(data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def pricing_job_result(request, pk):
+    """
+    Download the priced CSV of a completed job.
+    Requires session_token query parameter matching the job's session token.
+    The file is streamed with one row per input row: row, name,
+    square_footage, bedrooms, predicted_price and error.
+    """
+    job = _session_job(request, pk)
+    if job is None:
+        return Response(
+            {'error': 'Job not found or does not belong to this session'},
             status=status.HTTP_404_NOT_FOUND
         )
+    if job.status != PricingJob.COMPLETED:
+        return Response(
+            {'error': f'Job is {job.status}', 'status': job.status},
+            status=status.HTTP_409_CONFLICT
+        )
+    return FileResponse(
+        open(jobs.result_path(job), 'rb'),
+        as_attachment=True,
+        filename=f'pricing-{job.pk}.csv',
+        content_type='text/csv',
+    )
@@ -5,7 +5,7 @@ import { formatNumberWithCommas, formatCurrency } from './utils'
 
 interface PredictionResult {
     id: number
-    session_token: string
+    session_token?: string
     name: string
     square_footage: number
     bedrooms: number
@@ -52,7 +52,7 @@ export function HistoryPage({ onLogout }: HistoryProps) {
         setError('')
         try {
             const response = await axios.get(
-                `${API_BASE_URL}/session-data/?session_token=${token}`
+                `${API_BASE_URL}/session-data/?session_token=${token}&fields=id,name,square_footage,bedrooms,predicted_price,created_at`
             )
             setPredictions(response.data)
         } catch (err: any) {